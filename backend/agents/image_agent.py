@@ -1,11 +1,13 @@
 from crewai import Agent, Task, Crew
 import logging
 import base64
+import hashlib
 import json
 import re
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import os
 import traceback
+from utils.image_normalize import NormalizedImage, UnsupportedImageError, normalize_image, normalize_image_async
 
 logger = logging.getLogger("image_agent")
 logger.setLevel(logging.DEBUG)
@@ -61,17 +63,7 @@ def format_yolo_recommendations(obj):
 #   1) Radiology Report Agent (your logic preserved)
 # ============================================================
 
-def run_radiology_agent_for_image(img_bytes: bytes) -> str:
-    """
-    SAME NAME, SAME LOGIC, same behavior.
-    """
-
-    b64_image = base64.b64encode(img_bytes).decode("utf-8")
-    data_url = f"data:image/png;base64,{b64_image}"
-
-    client = OpenAI()
-
-    system_prompt = """
+RADIOLOGY_SYSTEM_PROMPT = """
 You are a board-certified radiologist with 20+ years of experience. 
 You will be given a medical image. Your job is to analyze it carefully and produce a structured radiology report.
 
@@ -102,30 +94,90 @@ Provide a 2–3 sentence overview. State the imaging modality (X-ray, MRI, CT, u
 # Impression
 Provide a 1–2 sentence radiology-style conclusion summarizing the most clinically significant finding or confirming a normal study.
 """
+
+RADIOLOGY_FALLBACK_REPORT = "[Error generating report] The radiology analysis service is currently unavailable."
+
+# Changes whenever the prompt text does, so cached reports (utils.imaging_cache)
+# from an older prompt are never served for the new one.
+RADIOLOGY_PROMPT_VERSION = hashlib.sha256(RADIOLOGY_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def radiology_model() -> str:
+    return os.getenv("RADIOLOGY_MODEL", "gpt-5.1")
+
+
+def radiology_request(image: NormalizedImage) -> dict:
+    """chat.completions.create kwargs shared by the sync and async agents."""
+    b64_image = base64.b64encode(image.data).decode("utf-8")
+    data_url = f"data:{image.mime_type};base64,{b64_image}"
+
+    return {
+        "model": radiology_model(),
+        "messages": [
+            {"role": "system", "content": RADIOLOGY_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": data_url}
+                    },
+                    {
+                        "type": "text",
+                        "text": "Analyze this medical image."
+                    }
+                ]
+            }
+        ],
+    }
+
+
+def run_radiology_agent_for_image(img_bytes: bytes) -> str:
+    """
+    SAME NAME, SAME LOGIC, same behavior.
+    """
+    client = OpenAI()
+
+    try:
+        image = normalize_image(img_bytes)
+        response = client.chat.completions.create(**radiology_request(image))
+    except UnsupportedImageError:
+        raise   # the upload itself is bad (415), not the service
+    except Exception as e:
+        print("Radiology chat completion failed, returning fallback message:", e)
+        traceback.print_exc()
+        return RADIOLOGY_FALLBACK_REPORT
+
+    return response.choices[0].message.content
+
+
+# One shared async client: its connection pool is what lets many analyses
+# run concurrently on one event loop.
+_async_client = None
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI()
+    return _async_client
+
+
+async def run_radiology_agent_for_image_async(img_bytes: bytes) -> str:
+    """
+    Non-blocking twin of run_radiology_agent_for_image for async handlers:
+    the event loop keeps serving other requests while the model thinks.
+    """
     try:
-        response = client.chat.completions.create(
-            model=os.getenv("RADIOLOGY_MODEL", "gpt-5.1"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": data_url}
-                        },
-                        {
-                            "type": "text",
-                            "text": "Analyze this medical image."
-                        }
-                    ]
-                }
-            ]
-        )
+        # Sniff + downscale + re-encode on a worker thread before upload
+        image = await normalize_image_async(img_bytes)
+        response = await get_async_client().chat.completions.create(**radiology_request(image))
+    except UnsupportedImageError:
+        raise   # the upload itself is bad (415), not the service
     except Exception as e:
         print("Radiology chat completion failed, returning fallback message:", e)
         traceback.print_exc()
-        return "[Error generating report] The radiology analysis service is currently unavailable."
+        return RADIOLOGY_FALLBACK_REPORT
 
     return response.choices[0].message.content
 
@@ -135,8 +187,9 @@ Provide a 1–2 sentence radiology-style conclusion summarizing the most clinica
 # ============================================================
 
 def get_annotation_instructions(img_bytes: bytes):
-    b64_image = base64.b64encode(img_bytes).decode("utf-8")
-    data_url = f"data:image/png;base64,{b64_image}"
+    image = normalize_image(img_bytes)
+    b64_image = base64.b64encode(image.data).decode("utf-8")
+    data_url = f"data:{image.mime_type};base64,{b64_image}"
 
     system_prompt = """
     You are a radiology annotation assistant.
@@ -181,11 +181,28 @@
 
 
 from crewai import Agent, Task, Crew
+import asyncio
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
 ContextType = Literal["imaging_report", "voice_symptoms"]
 
+# CrewAI's kickoff is synchronous. Async callers run it on this dedicated
+# pool, so slow recommendation calls never occupy the event loop or starve
+# asyncio's default to_thread pool.
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", "16"))
+_recommendation_pool = ThreadPoolExecutor(
+    max_workers=RECOMMENDATION_WORKERS, thread_name_prefix="recommendations"
+)
+
+
+# Disclaimers of the placeholder responses (see recommendations_parsed)
+NON_JSON_DISCLAIMER = "Non-JSON output returned — manual review required."
+FAIL_DISCLAIMER = "Please consult a doctor."
+FAIL_DOCTOR_REPORT = "Model returned no structured output."
+
 
 def generate_recommendations_from_text(
     input_text: str | dict,
@@ -295,22 +312,44 @@ def generate_recommendations_from_text(
             "self_care_advice": [],
             "urgency_level": "low",
             "red_flags": [],
-            "disclaimer": "Non-JSON output returned — manual review required."
+            "disclaimer": NON_JSON_DISCLAIMER
         }
     }
 
 
+async def generate_recommendations_from_text_async(
+    input_text: str | dict,
+    context_type: ContextType = "imaging_report",
+) -> dict:
+    """Non-blocking generate_recommendations_from_text for async handlers."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _recommendation_pool, generate_recommendations_from_text, input_text, context_type
+    )
+
+
 # Keep this helper at bottom
 def default_fail_response():
     return {
         "patient_friendly_report": "No recommendations generated.",
-        "doctor_friendly_report": "Model returned no structured output.",
+        "doctor_friendly_report": FAIL_DOCTOR_REPORT,
         "recommendations": {
             "diagnostic_tests": [],
             "specialist_referrals": [],
             "self_care_advice": [],
             "urgency_level": "low",
             "red_flags": [],
-            "disclaimer": "Please consult a doctor."
+            "disclaimer": FAIL_DISCLAIMER
         }
     }
+
+
+def recommendations_parsed(result) -> bool:
+    """False for the placeholders above (no output / non-JSON output) — never cache those."""
+    if not isinstance(result, dict) or not result:
+        return False
+    inner = result.get("recommendations")
+    disclaimer = inner.get("disclaimer") if isinstance(inner, dict) else None
+    if disclaimer == NON_JSON_DISCLAIMER:
+        return False
+    return not (disclaimer == FAIL_DISCLAIMER and result.get("doctor_friendly_report") == FAIL_DOCTOR_REPORT)
@@ -0,0 +1,130 @@
+"""
+Concurrency benchmark for the /analyze/image handler shapes, no API calls.
+
+run from backend/:  python -m benchmarks.image_agent_concurrency
+
+The OpenAI SDK is pointed (OPENAI_BASE_URL) at a local stub server that
+answers every chat completion after LLM_LATENCY seconds, and crewai is
+replaced by a stub whose kickoff sleeps just as long. The agents themselves
+run unmodified: same SDK clients, normalization and recommendation code.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LLM_LATENCY = 0.3   # seconds per stubbed model call
+CONCURRENT_UPLOADS = 20
+
+# 1x1 PNG: real image bytes, so normalization accepts it
+STUB_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+# ------------------------------------------------------
+# Stub chat completions server
+# ------------------------------------------------------
+class StubCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LLM_LATENCY)
+        body = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "# Summary\nStub report."},
+            }],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCompletionsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+# ------------------------------------------------------
+# Stub crewai (recommendation agent)
+# ------------------------------------------------------
+def install_stub_crewai():
+    class Crew:
+        def __init__(self, **kwargs):
+            pass
+
+        def kickoff(self):
+            time.sleep(LLM_LATENCY)
+            return types.SimpleNamespace(
+                json_dict=None,
+                raw=json.dumps({"recommendations": {"urgency_level": "low"}}),
+            )
+
+    crewai = types.ModuleType("crewai")
+    crewai.Agent = crewai.Task = lambda **kwargs: None
+    crewai.Crew = Crew
+    sys.modules["crewai"] = crewai
+
+
+async def bench(handler):
+    lag = []
+
+    async def health_probe():
+        # Stands in for /health etc. hitting the same worker meanwhile
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag.append(time.perf_counter() - t - 0.01)
+
+    probe = asyncio.create_task(health_probe())
+    started = time.perf_counter()
+    await asyncio.gather(*[handler(STUB_IMAGE) for _ in range(CONCURRENT_UPLOADS)])
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.02)   # let the probe report a stall still in progress
+    probe.cancel()
+    print(f"{handler.__name__:22s} {CONCURRENT_UPLOADS} uploads in {elapsed:5.2f}s "
+          f"({CONCURRENT_UPLOADS / elapsed:5.1f} analyses/s), worst stall of other requests {max(lag or [0]):5.2f}s")
+
+
+def main():
+    os.environ["OPENAI_BASE_URL"] = start_stub_server()
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    install_stub_crewai()
+
+    from agents import image_agent, recommendation_agent
+
+    # The two shapes of the /analyze/image handler body
+    async def blocking_handler(img):
+        report = image_agent.run_radiology_agent_for_image(img)
+        return report, recommendation_agent.generate_recommendations_from_text(report)
+
+    async def non_blocking_handler(img):
+        report = await image_agent.run_radiology_agent_for_image_async(img)
+        return report, await recommendation_agent.generate_recommendations_from_text_async(report)
+
+    asyncio.run(bench(blocking_handler))
+    asyncio.run(bench(non_blocking_handler))
+
+
+if __name__ == "__main__":
+    main()
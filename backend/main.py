@@ -1,6 +1,10 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-import asyncpg
+from fastapi.responses import JSONResponse
+from utils.circuit_breaker import breaker_metrics
+from utils.db import ensure_imaging_schema
+from utils.analytics_views import maintain_analytics_views, urgency_from_recommendations
+import asyncio
 import os
 import base64
 from dotenv import load_dotenv
@@ -45,7 +49,13 @@ app.add_middleware(
 # ------------------------------------------------------
 from routers.voice_router import router as voice_router
 from routers.history_router import router as history_router
-from routes.predict import router as predict_router
+from routes.predict import (
+    router as predict_router,
+    refresh_risk_table_in_background,
+    warm_up_model,
+    model_status,
+    inference_executor,
+)
 from routes.GraphicalRepresentation import router as graph_router
 
 # Register routers
@@ -55,31 +65,100 @@ app.include_router(graph_router)            # /graph/*
 app.include_router(predict_router, prefix="/api")   # /api/*
 
 
+@app.on_event("startup")
+async def warm_up_prediction_model():
+    """
+    Load + warm the risk model on a worker thread right after startup, then
+    precompute the CSV risk table. Runs in the background so /health answers
+    immediately; /ready reports when the model is hot.
+    """
+    async def warm_up():
+        await asyncio.to_thread(warm_up_model)
+        refresh_risk_table_in_background()
+
+    app.state.model_warmup = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+def stop_inference_executor():
+    inference_executor.shutdown()
+
+
+@app.on_event("startup")
+async def prepare_imaging_schema():
+    """
+    Add the optional imaging_results columns (urgency_level, content_key,
+    recommendations) before the first request is served. History inserts
+    only use the columns that exist, so a refused ALTER never breaks saving
+    results.
+    """
+    if not DATABASE_URL:
+        return
+    try:
+        await ensure_imaging_schema()
+    except Exception as e:
+        print("Imaging schema check failed:", e)
+
+
+@app.on_event("startup")
+async def start_analytics_refresh():
+    """
+    Create the /graph/activity/* materialized views and refresh them every
+    ANALYTICS_REFRESH_SECONDS in the background, so dashboard reads never
+    aggregate the raw tables. Only one worker process (advisory-lock holder)
+    does this at a time.
+    """
+    if not DATABASE_URL:
+        return
+
+    app.state.analytics_refresh = asyncio.create_task(maintain_analytics_views())
+
+
 @app.get("/health")
 def health_check():
     """Simple health endpoint to verify the server and CORS behavior quickly."""
     return {"status": "ok"}
 
+
+@app.get("/metrics/circuit-breakers")
+def circuit_breaker_metrics():
+    """Current state of every LLM model circuit breaker (insight + transcription chains)."""
+    return {"breakers": breaker_metrics()}
+
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness for load balancers: 503 until the risk model is loaded and warmed."""
+    status = model_status()
+    if status["status"] != "ready":
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 # ------------------------------------------------------
 # Database Connection
 # ------------------------------------------------------
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-async def get_pg_pool():
-    return await asyncpg.create_pool(DATABASE_URL)
-
 # ------------------------------------------------------
 # Import ML + Image Agents AFTER app creation
 # ------------------------------------------------------
-from utils.db import save_imaging_result
+from utils.db import save_imaging_result, get_pg_pool
 from agents.report_agent import run_radiology_agent
 from tools.file_tools import extract_pdf_pages
 from agents.image_agent import (
-    run_radiology_agent_for_image,
+    RADIOLOGY_FALLBACK_REPORT,
+    RADIOLOGY_PROMPT_VERSION,
+    radiology_model,
+    run_radiology_agent_for_image_async,
     get_annotation_instructions
 )
+from utils.imaging_cache import ImagingReportCache, imaging_cache_key, is_cacheable_report
+from utils.image_normalize import normalization_signature, unsupported_image_reason, UnsupportedImageError
 
-from agents.recommendation_agent import generate_recommendations_from_text
+from agents.recommendation_agent import (
+    generate_recommendations_from_text_async,
+    recommendations_parsed,
+)
 
 
 
@@ -87,64 +166,114 @@ from agents.recommendation_agent import generate_recommendations_from_text
 import json
 import traceback
 
-@app.post("/analyze/image")
-async def analyze_image(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(400, "Unsupported image type")
+# Re-uploads of the same study (same bytes, model and prompt) skip the vision call
+imaging_cache = ImagingReportCache()
 
-    try:
-        # 1️⃣ Read bytes
-        img_bytes = await file.read()
 
-        # 2️⃣ Radiology report
+def image_content_key(img_bytes: bytes) -> str:
+    # Normalization settings change what the model sees, so they are part of the key
+    return imaging_cache_key(
+        img_bytes, radiology_model(), f"{RADIOLOGY_PROMPT_VERSION}:{normalization_signature()}"
+    )
+
+
+@app.get("/metrics/imaging-cache")
+def imaging_cache_metrics():
+    return imaging_cache.stats()
+
+
+async def run_image_analysis(filename: str, img_bytes: bytes) -> dict:
+    """Full single-image pipeline (shared by /analyze/image and image jobs)."""
+    # Unknown bytes / DICOM would only be rejected by the vision API
+    reason = unsupported_image_reason(img_bytes)
+    if reason:
+        raise UnsupportedImageError(reason)
+
+    # Same study seen before? (memory → Postgres content-addressed cache)
+    content_key = image_content_key(img_bytes)
+    cached, cache_tier = await imaging_cache.get(content_key)
+
+    # 2️⃣ Radiology report (async client — the event loop stays free)
+    if cached:
+        report = cached["report"]
+    else:
         try:
-            report = run_radiology_agent_for_image(img_bytes)
+            report = await run_radiology_agent_for_image_async(img_bytes)
+        except UnsupportedImageError:
+            raise   # corrupt upload → 415
         except Exception as lm_err:
             # If the LLM fails, log the error and return a helpful placeholder
             print("Radiology agent failed:", lm_err)
             traceback.print_exc()
-            report = "[Error generating report] The radiology analysis service is currently unavailable."
+            report = RADIOLOGY_FALLBACK_REPORT
 
+    # 3️⃣ Recommendations (sync CrewAI → dedicated worker pool)
+    recommendations = cached.get("recommendations") if cached else None
+    if not recommendations:
         try:
-            recommendations = generate_recommendations_from_text(report, "imaging_report")
+            recommendations = await generate_recommendations_from_text_async(report, "imaging_report")
         except Exception as rec_err:
             print("Recommendation generation failed:", rec_err)
             traceback.print_exc()
             recommendations = []
 
-        # Previously we ran YOLO and returned annotated images. That has been
-        # removed; keep API response keys but return empty placeholders so the
-        # frontend continues to work without changes.
-        findings = []
-        annotated_b64 = None
-        yolo_markdown = ""
+    # Placeholder recommendations (CrewAI failed / non-JSON) are neither cached
+    # nor counted: a re-upload regenerates them, and the analytics get no fake urgency
+    parsed = recommendations_parsed(recommendations)
+    imaging_cache.set(content_key, report, recommendations if parsed else None)
 
-        # Save to DB (annotated_img left as None). If DB fails, log and continue
-        try:
-            saved_id = await save_imaging_result(
-                file_name=file.filename,
-                report=report,
-                annotated_img=annotated_b64,
-                findings=findings,
-            )
-        except Exception as db_err:
-            print("Failed to save imaging result:", db_err)
-            traceback.print_exc()
-            saved_id = None
+    # Previously we ran YOLO and returned annotated images. That has been
+    # removed; keep API response keys but return empty placeholders so the
+    # frontend continues to work without changes.
+    findings = []
+    annotated_b64 = None
+    yolo_markdown = ""
+
+    # Save to DB (annotated_img left as None). If DB fails, log and continue
+    try:
+        saved_id = await save_imaging_result(
+            file_name=filename,
+            report=report,
+            annotated_img=annotated_b64,
+            findings=findings,
+            urgency_level=urgency_from_recommendations(recommendations) if parsed else None,
+            content_key=content_key if is_cacheable_report(report) else None,
+            recommendations=recommendations if parsed else None,
+        )
+    except Exception as db_err:
+        print("Failed to save imaging result:", db_err)
+        traceback.print_exc()
+        saved_id = None
+
+    return {
+        "id": saved_id,
+        "filename": filename,
+        "report": report,
+        "annotations": findings,
+        "annotated_image": annotated_b64,
+        "recommendations": recommendations,
+        "yolo_explanation": yolo_markdown,
+        "cached": cached is not None,
+        "cache_tier": cache_tier,
+    }
 
-        return {
-            "id": saved_id,
-            "filename": file.filename,
-            "report": report,
-            "annotations": findings,
-            "annotated_image": annotated_b64,
-            "recommendations": recommendations,
-            "yolo_explanation": yolo_markdown,
-        }
+
+@app.post("/analyze/image")
+async def analyze_image(file: UploadFile = File(...)):
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(400, "Unsupported image type")
+
+    try:
+        # 1️⃣ Read bytes
+        img_bytes = await file.read()
+
+        return await run_image_analysis(file.filename, img_bytes)
 
     except HTTPException:
         # Re-raise any explicit HTTPExceptions
         raise
+    except UnsupportedImageError as e:
+        raise HTTPException(415, str(e))
     except Exception as e:
         print("Unhandled error in /analyze/image:", e)
         traceback.print_exc()
@@ -152,30 +281,85 @@ async def analyze_image(file: UploadFile = File(...)):
 
 
 from typing import List
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+from routes.predict import sse_event
 
-@app.post("/analyze/images")
-async def analyze_multiple_images(files: List[UploadFile] = File(...)):
-    results = []
+# Images of one upload are analyzed concurrently, at most this many at once,
+# each with its own timeout so one slow or failing image can't sink the batch.
+ANALYZE_IMAGES_CONCURRENCY = int(os.getenv("ANALYZE_IMAGES_CONCURRENCY", "4"))
+ANALYZE_IMAGE_TIMEOUT = float(os.getenv("ANALYZE_IMAGE_TIMEOUT", "120"))
 
-    for file in files:
-        img_bytes = await file.read()
 
+def rejected_image_result(index: int, filename: str, reason: str):
+    """Per-image result for an upload the vision model can't be sent (the 415 cases)."""
+    return {
+        "index": index,
+        "filename": filename,
+        "report": f"[Error] {reason}",
+        "findings": [],
+        "annotated_image": None,
+        "error": reason,
+        "cached": False,
+        "cache_tier": None,
+    }
+
+
+async def analyze_one_image(index: int, filename: str, img_bytes: bytes, semaphore: asyncio.Semaphore):
+    reason = unsupported_image_reason(img_bytes)
+    if reason:
+        return rejected_image_result(index, filename, reason)
+
+    error = None
+    content_key = image_content_key(img_bytes)
+    cached, cache_tier = await imaging_cache.get(content_key)
+    if cached:
+        return {
+            "index": index,
+            "filename": filename,
+            "report": cached["report"],
+            "findings": [],
+            "annotated_image": None,
+            "error": None,
+            "cached": True,
+            "cache_tier": cache_tier,
+        }
+
+    async with semaphore:
         try:
-            report = run_radiology_agent_for_image(img_bytes)
+            report = await asyncio.wait_for(
+                run_radiology_agent_for_image_async(img_bytes), ANALYZE_IMAGE_TIMEOUT
+            )
+        except UnsupportedImageError as e:
+            return rejected_image_result(index, filename, str(e))
+        except asyncio.TimeoutError:
+            print(f"Radiology agent timed out for {filename} after {ANALYZE_IMAGE_TIMEOUT:g}s")
+            error = f"Timed out after {ANALYZE_IMAGE_TIMEOUT:g}s"
+            report = RADIOLOGY_FALLBACK_REPORT
         except Exception as e:
-            print(f"Radiology agent failed for {file.filename}:", e)
-            report = "[Error generating report] The radiology analysis service is currently unavailable."
+            print(f"Radiology agent failed for {filename}:", e)
+            error = str(e)
+            report = RADIOLOGY_FALLBACK_REPORT
 
-        findings = []
+    # The async agent reports its own failures (API error, bad image, ...) as the fallback text
+    if error is None and report == RADIOLOGY_FALLBACK_REPORT:
+        error = "Radiology analysis failed"
+
+    imaging_cache.set(content_key, report)
+    return {
+        "index": index,
+        "filename": filename,
+        "report": report,
+        "findings": [],
+        "annotated_image": None,
+        "error": error,
+        "cached": False,
+        "cache_tier": None,
+    }
 
-        results.append({
-            "filename": file.filename,
-            "report": report,
-            "findings": findings,
-            "annotated_image": None,
-        })
 
-    # Combined summary (very simple version)
+def combine_image_results(results):
+    # Combined summary (very simple version), in upload order
     combined_report = "\n\n".join([r["report"] for r in results])
     combined_findings = [f for r in results for f in r["findings"]]
 
@@ -186,6 +370,58 @@ async def analyze_multiple_images(files: List[UploadFile] = File(...)):
     }
 
 
+async def run_images_analysis(uploads) -> dict:
+    """Analyze [(filename, bytes), ...] concurrently (shared by /analyze/images and image-batch jobs)."""
+    semaphore = asyncio.Semaphore(max(1, ANALYZE_IMAGES_CONCURRENCY))
+    results = await asyncio.gather(*[
+        analyze_one_image(i, filename, img_bytes, semaphore)
+        for i, (filename, img_bytes) in enumerate(uploads)
+    ])
+    return combine_image_results(list(results))
+
+
+@app.post("/analyze/images")
+async def analyze_multiple_images(files: List[UploadFile] = File(...), stream: bool = Query(False)):
+    """
+    Analyze every uploaded image concurrently (ANALYZE_IMAGES_CONCURRENCY at
+    a time). Results keep upload order; a failed or timed-out image gets a
+    placeholder report and an "error" instead of failing the request.
+
+    ?stream=true answers with Server-Sent Events instead: an "image" event
+    per image as soon as it finishes (with its "index"), then "done" with
+    the combined result.
+    """
+    uploads = [(file.filename, await file.read()) for file in files]
+
+    if not stream:
+        return await run_images_analysis(uploads)
+
+    semaphore = asyncio.Semaphore(max(1, ANALYZE_IMAGES_CONCURRENCY))
+    tasks = [
+        asyncio.create_task(analyze_one_image(i, filename, img_bytes, semaphore))
+        for i, (filename, img_bytes) in enumerate(uploads)
+    ]
+
+    async def events():
+        results = [None] * len(tasks)
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                results[result["index"]] = result
+                yield sse_event("image", result)
+            yield sse_event("done", combine_image_results(results))
+        finally:
+            # Client went away mid-stream: stop the analyses still running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 
 # ------------------------------------------------------
 # PDF ANALYSIS
@@ -197,30 +433,146 @@ async def analyze_pdf(file: UploadFile = File(...)):
 
     try:
         pdf_bytes = await file.read()
-        pdf_data = extract_pdf_pages(pdf_bytes)
+        return await run_pdf_analysis(file.filename, pdf_bytes)
+
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+async def run_pdf_analysis(filename: str, pdf_bytes: bytes) -> dict:
+    """PDF pipeline (shared by /analyze and PDF jobs). The sync agent runs on a worker thread."""
+    pdf_data = await asyncio.to_thread(extract_pdf_pages, pdf_bytes)
+    try:
+        report = await asyncio.to_thread(run_radiology_agent, pdf_data)
+    except Exception as lm_err:
+        print("Radiology agent failed for PDF:", lm_err)
+        traceback.print_exc()
+        report = RADIOLOGY_FALLBACK_REPORT
+
+    # Shared pool from utils.db (one pool per process)
+    pool = await get_pg_pool()
+    async with pool.acquire() as con:
         try:
-            report = run_radiology_agent(pdf_data)
-        except Exception as lm_err:
-            print("Radiology agent failed for PDF:", lm_err)
+            await con.execute(
+                """
+                INSERT INTO radiology_reports (filename, report)
+                VALUES ($1, $2)
+                """,
+                filename,
+                report,
+            )
+        except Exception as db_err:
+            print("Failed to save PDF report:", db_err)
             traceback.print_exc()
-            report = "[Error generating report] The radiology analysis service is currently unavailable."
-
-        pool = await get_pg_pool()
-        async with pool.acquire() as con:
-            try:
-                await con.execute(
-                    """
-                    INSERT INTO radiology_reports (filename, report)
-                    VALUES ($1, $2)
-                    """,
-                    file.filename,
-                    report,
-                )
-            except Exception as db_err:
-                print("Failed to save PDF report:", db_err)
-                traceback.print_exc()
-
-        return {"filename": file.filename, "report": report}
 
+    return {"filename": filename, "report": report}
+
+
+# ------------------------------------------------------
+# ASYNC JOBS (submit → 202, poll /jobs/{id} or get a callback)
+# ------------------------------------------------------
+from fastapi import Header
+from typing import Optional
+from utils.jobs import JobQueue, check_callback_url
+
+job_queue = JobQueue()
+
+
+async def image_job(files):
+    filename, _, img_bytes = files[0]
+    return await run_image_analysis(filename, img_bytes)
+
+
+async def images_job(files):
+    return await run_images_analysis([(filename, data) for filename, _, data in files])
+
+
+async def pdf_job(files):
+    filename, _, pdf_bytes = files[0]
+    return await run_pdf_analysis(filename, pdf_bytes)
+
+
+job_queue.register("image", image_job)
+job_queue.register("images", images_job)
+job_queue.register("pdf", pdf_job)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Recover jobs left behind by a previous run and start the worker pool."""
+    if not job_queue.available:
+        return
+    try:
+        await job_queue.start()
     except Exception as e:
-        raise HTTPException(500, str(e))
+        print("Job queue unavailable:", e)
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+
+
+async def submit_job(kind: str, files: list, callback_url: Optional[str], idempotency_key: Optional[str]):
+    if not job_queue.available:
+        raise HTTPException(503, "Job queue requires DATABASE_URL")
+    if callback_url:
+        reason = await check_callback_url(callback_url)
+        if reason:
+            raise HTTPException(400, reason)
+
+    uploads = [(f.filename, f.content_type, await f.read()) for f in files]
+    if kind == "image":
+        reason = unsupported_image_reason(uploads[0][2])
+        if reason:
+            raise HTTPException(415, reason)
+    job, created = await job_queue.submit(kind, uploads, callback_url, idempotency_key)
+    return JSONResponse(
+        status_code=202 if created else 200,
+        content={
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/jobs/{job['job_id']}",
+        },
+    )
+
+
+@app.post("/jobs/analyze/image", status_code=202)
+async def submit_image_job(
+    file: UploadFile = File(...),
+    callback_url: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(400, "Unsupported image type")
+    return await submit_job("image", [file], callback_url, idempotency_key)
+
+
+@app.post("/jobs/analyze/images", status_code=202)
+async def submit_images_job(
+    files: List[UploadFile] = File(...),
+    callback_url: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await submit_job("images", files, callback_url, idempotency_key)
+
+
+@app.post("/jobs/analyze", status_code=202)
+async def submit_pdf_job(
+    file: UploadFile = File(...),
+    callback_url: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(400, "Only PDF files allowed")
+    return await submit_job("pdf", [file], callback_url, idempotency_key)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    if not job_queue.available:
+        raise HTTPException(503, "Job queue requires DATABASE_URL")
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return job
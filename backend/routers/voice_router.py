@@ -4,6 +4,7 @@ import os
 from crewai import Agent, Task, Crew
 from agents.recommendation_agent import generate_recommendations_from_text
 from utils.db import save_interaction, save_voice_result
+from utils.circuit_breaker import get_breaker
 import traceback
 
 router = APIRouter()
@@ -50,14 +51,21 @@ async def transcribe_audio(file: UploadFile = File(...)):
         transcription = None
         last_err = None
         for model_name in candidate_models:
+            # Skip models whose circuit breaker is open (known-bad for a while)
+            breaker = get_breaker(f"transcribe:{model_name}")
+            if not breaker.allow():
+                continue
             try:
                 print(f"Attempting transcription with model: {model_name}")
                 transcription = c.audio.transcriptions.create(
                     model=model_name, file=(file.filename, audio_bytes)
                 )
+                breaker.record_success()
                 break
             except Exception as e:
                 last_err = e
+                # Bad uploads (BadRequestError) never open the breaker
+                breaker.record_error(e)
                 print(f"Model {model_name} failed: {e}")
 
         if transcription is None:
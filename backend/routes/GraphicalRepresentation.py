@@ -1,65 +1,65 @@
-from fastapi import APIRouter
-from sqlalchemy import text
-from utils.db import engine   # existing DB connection
+from fastapi import APIRouter, HTTPException, Query
+from utils.db import engine, DATABASE_URL   # existing DB connection
+from utils.dataset_aggregates import get_aggregates   # cached, one-pass distributions
+from utils.analytics_views import daily_activity, urgency_counts   # materialized views
 if engine is None:
     print("DB not available. GraphicalRepresentation will use fallback logic.")
 
 router = APIRouter()
 
-# backend/routes/graphs.py
-import pandas as pd
-from fastapi import APIRouter
 
-router = APIRouter()
+# Combined API — every distribution in one request (one dashboard round trip)
+@router.get("/graph/summary")
+def graph_summary():
+    return get_aggregates()
+
 
 @router.get("/graph/visit-distribution")
 def visit_distribution():
-    df = pd.read_csv("healthvisionpro_dataset_1000.csv")
-
-    # group by visit count
-    dist = (
-        df["visit_count"]
-        .value_counts()
-        .sort_index()
-        .reset_index()
-        .rename(columns={"index": "visits", "visit_count": "patients"})
-    )
-
-    return {
-        "labels": dist["visits"].tolist(),
-        "values": dist["patients"].tolist()
-    }
+    return get_aggregates()["visit_distribution"]
 
 
 
 # NEW API — Heart Disease Distribution
 @router.get("/graph/heart-disease")
 def heart_disease():
-    df = pd.read_csv("healthvisionpro_dataset_1000.csv")
-    counts = df["heart_disease"].value_counts().to_dict()
-    return {
-        "labels": ["No Heart Disease", "Heart Disease"],
-        "values": [counts.get(0, 0), counts.get(1, 0)]
-    }
+    return get_aggregates()["heart_disease"]
 
 
 # NEW API — Smoking Status Distribution
 @router.get("/graph/smoking-status")
 def smoking_status():
-    df = pd.read_csv("healthvisionpro_dataset_1000.csv")
-    counts = df["smoking_status"].value_counts().to_dict()
-    return {
-        "labels": ["Non-Smoker", "Smoker"],
-        "values": [counts.get(0, 0), counts.get(1, 0)]
-    }
+    return get_aggregates()["smoking_status"]
 
 
 # NEW API — Diabetes Distribution
 @router.get("/graph/diabetes")
 def diabetes():
-    df = pd.read_csv("healthvisionpro_dataset_1000.csv")
-    counts = df["diabetes"].value_counts().to_dict()
-    return {
-        "labels": ["No Diabetes", "Diabetic"],
-        "values": [counts.get(0, 0), counts.get(1, 0)]
-    }
+    return get_aggregates()["diabetes"]
+
+
+# ---------------------------------------------------------
+# Live activity (Postgres) — served from materialized views
+# refreshed by a startup background task (see main.py)
+# ---------------------------------------------------------
+def require_db():
+    if not DATABASE_URL:
+        raise HTTPException(503, "Database not configured; live activity graphs are unavailable")
+
+
+@router.get("/graph/activity/daily")
+async def activity_daily(days: int = Query(30, ge=1, le=365)):
+    """Imaging, voice and interaction analyses per day (last `days` days)."""
+    require_db()
+    return await daily_activity(days)
+
+
+@router.get("/graph/activity/urgency")
+async def activity_urgency():
+    """Imaging analyses per recommendation urgency level."""
+    require_db()
+    try:
+        return await urgency_counts()
+    except Exception as e:
+        print("Urgency graph failed:", e)
+        raise HTTPException(503, "Urgency analytics not available yet")
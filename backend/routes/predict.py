@@ -1,12 +1,30 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 import joblib
 import numpy as np
 import os
-# shap can be optional at import time; we import it when needed inside ensure_model_loaded
+# shap is optional: XGBoost contributions come from the booster (utils.contributions)
 import pandas as pd
-import asyncpg
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import json
+import math
+import asyncio
+from typing import Optional
+import threading
+import time
+from utils.dataset import CSV_PATH as DATASET_CSV_PATH, on_dataset_load, reload_dataset_if_changed
+from utils.patient_index import PatientIndex, VisitBuckets
+from utils.patient_search import PatientSearchIndex
+from utils.cache import TTLCache
+from utils.contributions import ContributionEngine
+from utils.feature_encoding import age_group_for, build_encoding_plan, encode_records
+from utils.model_artifacts import load_model_file, predict_class_and_proba
+from utils.model_registry import ModelBundle, ModelRegistry
+from utils.inference_executor import InferenceExecutor, MicroBatcher
+from utils.insight_cache import InsightCache, insight_cache_key
+from utils.circuit_breaker import get_breaker, is_model_unavailable_error
+from utils.db import get_pg_pool
 
 router = APIRouter()
 
@@ -15,17 +33,8 @@ router = APIRouter()
 # ------------------------------------
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 
-MODEL_PATH = os.path.join(BASE_DIR, "xgboost_health_model.pkl")
-ENCODER_PATH = os.path.join(BASE_DIR, "encoders.pkl")
-FEATURE_ORDER_PATH = os.path.join(BASE_DIR, "feature_order.pkl")
-CSV_PATH = os.path.join(BASE_DIR, "healthvisionpro_dataset_1000.csv")
-
-try:
-    dataset_df = pd.read_csv(CSV_PATH)
-    print("✅ CSV loaded from:", CSV_PATH)
-except Exception as e:
-    print("❌ CSV load failed:", e)
-    dataset_df = pd.DataFrame()
+# Artifact paths (xgboost_health_model.*, encoders.pkl, feature_order.pkl) and
+# versioned model directories are resolved by utils.model_registry.
 
 
 from pathlib import Path
@@ -40,137 +49,489 @@ with open(METRICS_FILE, "r") as f:
 #     model_metrics = json.load(f)
 
 
-# Lazy model loading to avoid import-time failures (server should start even if model files are missing)
-model = None
-encoders = None
-feature_order = None
-explainer = None
+# Lazy model loading to avoid import-time failures (server should start even if model files are missing).
+# model / encoders / feature_order / explainer / encoding_plan live together in
+# one ModelBundle; the registry swaps the whole bundle when a new version ships.
+# Handlers take ONE reference (current_bundle()) and use it for the whole request.
 MODEL_LOAD_ERROR = None
 
+# What to do with a categorical value the encoders never saw during training:
+#   "error"   -> reject the patient (same as LabelEncoder.transform)
+#   "missing" -> encode as NaN so XGBoost follows each split's default branch
+UNSEEN_CATEGORY_POLICY = os.getenv("UNSEEN_CATEGORY_POLICY", "error").strip().lower()
+
+
+def unseen_category_code(col, value):
+    if UNSEEN_CATEGORY_POLICY == "missing":
+        return np.nan
+    raise ValueError(f"Unseen value for {col}: {value!r}")
+
+
+def load_bundle(source):
+    """Load model, encoders and feature order for one version into a ModelBundle."""
+    # Native booster artifact when present, else the pickled XGBClassifier
+    loaded_model = load_model_file(source.model_path)
+    loaded_encoders = joblib.load(source.encoders_path)
+    loaded_feature_order = joblib.load(source.feature_order_path)
+    try:
+        # Native XGBoost contributions; shap is only imported for other model types
+        bundle_explainer = ContributionEngine(loaded_model)
+        print("Contribution engine backend:", bundle_explainer.backend)
+    except Exception:
+        # shap is optional; some environments don't have it installed
+        print("shap not available or failed to build explainer; continuing without shap explanations")
+        bundle_explainer = None
+
+    return ModelBundle(
+        source,
+        model=loaded_model,
+        encoders=loaded_encoders,
+        feature_order=loaded_feature_order,
+        encoding_plan=build_encoding_plan(loaded_encoders, loaded_feature_order),
+        explainer=bundle_explainer,
+        metrics=source.load_metrics(),
+    )
+
+
+def warm_bundle(bundle):
+    """One dummy-row inference + explanation so the first real request is hot."""
+    dummy = np.zeros((1, len(bundle.feature_order)))
+    predict_class_and_proba(bundle.model, dummy)
+    explain_matrix(dummy, bundle)
+
+
+model_registry = ModelRegistry(load_bundle, warm_bundle)
+MODEL_READY = False
+_ready_lock = threading.Lock()
+
+# Request-path inference runs on this pool, never on the event loop; concurrent
+# single-patient requests are coalesced into one matrix call (utils.inference_executor)
+inference_executor = InferenceExecutor()
+micro_batcher = MicroBatcher(inference_executor)
+
+
+def current_bundle():
+    """The ModelBundle serving right now (None until the first load)."""
+    return model_registry.active
+
 
 def ensure_model_loaded():
-    """Attempt to load model, encoders and feature order on first use.
-    If loading fails, set MODEL_LOAD_ERROR and leave module-level objects None.
+    """Load the selected model version once (single-flight).
+    Concurrent callers wait on the registry's lock so joblib.load / the
+    explainer build only ever run once. If loading fails, set
+    MODEL_LOAD_ERROR so a later call can retry.
     """
-    global model, encoders, feature_order, explainer, MODEL_LOAD_ERROR
+    global MODEL_LOAD_ERROR
 
-    if model is not None and encoders is not None and feature_order is not None:
+    if model_registry.active is not None:
         return True
 
-    try:
-        model = joblib.load(MODEL_PATH)
-        encoders = joblib.load(ENCODER_PATH)
-        feature_order = joblib.load(FEATURE_ORDER_PATH)
-        try:
-            import shap as _shap
-            explainer = _shap.TreeExplainer(model)
-        except Exception:
-            # shap is optional; some environments don't have it installed
-            print("shap not available or failed to build explainer; continuing without shap explanations")
-            explainer = None
+    loaded = model_registry.ensure_loaded()
+    MODEL_LOAD_ERROR = model_registry.last_error
+    if loaded:
         print("Model, encoders & feature order loaded successfully!")
-        MODEL_LOAD_ERROR = None
-        return True
-    except Exception as e:
-        MODEL_LOAD_ERROR = str(e)
-        print("Warning: Failed to load model or encoders:", MODEL_LOAD_ERROR)
+        mark_model_ready()
+    return loaded
+
+
+def mark_model_ready():
+    """
+    Start the version watcher and the inference pool, then report ready.
+    Runs after the first successful load — whether that was the startup
+    warm-up or a later lazy load after the warm-up failed. Idempotent.
+    """
+    global MODEL_READY
+    with _ready_lock:
+        if MODEL_READY:
+            return
+        model_registry.start_watcher()
+        inference_executor.start(current_bundle())
+        MODEL_READY = True
+
+
+def warm_up_model():
+    """
+    Load everything so the first real request does not pay for lazy
+    initialisation (the registry runs one dummy-row inference + explanation
+    on every bundle it loads). Afterwards the registry watches for new
+    model versions and hot-swaps them.
+    Blocking — call it from a worker thread.
+    """
+    started = time.perf_counter()
+    if not ensure_model_loaded():
         return False
 
-# Load CSV dataset only once (fail gracefully if the CSV is missing)
-try:
-    dataset_df = pd.read_csv(CSV_PATH)
-except Exception as e:
-    print("Warning: failed to load CSV dataset:", e)
-    dataset_df = pd.DataFrame()
+    print(f"✅ Model warm-up done in {time.perf_counter() - started:.2f}s")
+    return True
+
+
+def model_status():
+    """Readiness info for the /ready endpoint."""
+    if MODEL_READY:
+        return {"status": "ready", "model_version": current_bundle().version}
+    if MODEL_LOAD_ERROR:
+        return {"status": "error", "error": MODEL_LOAD_ERROR}
+    return {"status": "loading"}
+
+
+
+def detect_visit_column(df):
+    """Name of the visit-count column, or None."""
+    for col in ("patients_visited", "visit_count"):
+        if col in df.columns:
+            return col
+    return None
+
+
+def index_dataset(df):
+    """(Re)build every in-memory index over the CSV dataset."""
+    global dataset_df, patient_index, patient_search, visit_buckets
+    dataset_df = df
+    visit_col = detect_visit_column(df)
+    patient_index = PatientIndex(df)
+    patient_search = PatientSearchIndex(df, visit_col=visit_col)
+    visit_buckets = VisitBuckets(df, visit_col) if visit_col else None
+    print("✅ Patient index:", patient_index.describe())
+    print("✅ Patient search index:", patient_search.describe())
+
+
+# The dataset is loaded once by utils.dataset (shared with the graph routes);
+# indexes are rebuilt whenever it reloads.
+on_dataset_load(index_dataset)
 
 # SHAP explainer is created when the model is loaded (see ensure_model_loaded)
 
 # OpenAI client
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Async client for the SSE summary stream: an open stream then costs a
+# coroutine, not a threadpool thread (created lazily, shares one connection pool)
+_async_client = None
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _async_client
+
 
 # ---------------------------------------------------------
 # PREPROCESS FUNCTION — must appear BEFORE usage
 # ---------------------------------------------------------
-def preprocess(patient: dict):
-    
+def preprocess(patient: dict, bundle=None):
+    bundle = bundle or current_bundle()
+
     # Auto-create age_group if missing
     if "age_group" not in patient and "age" in patient:
-        age = int(patient["age"])
-        if age < 40:
-            patient["age_group"] = "20-40"
-        elif age <= 60:
-            patient["age_group"] = "40-60"
-        else:
-            patient["age_group"] = "60+"
+        patient["age_group"] = age_group_for(patient["age"])
+
+    X = np.empty((1, len(bundle.encoding_plan)))
+
+    for j, (col, lookup) in enumerate(bundle.encoding_plan):
+        value = patient[col]
+        if lookup is None:  # numeric columns
+            X[0, j] = float(value)
+        else:  # categorical columns
+            code = lookup.get(value)
+            X[0, j] = unseen_category_code(col, value) if code is None else code
+
+    return X, bundle.feature_order
+
+
+def preprocess_batch(patients: list, bundle=None):
+    """
+    Build ONE feature matrix for many patients using the encoding plan.
+
+    Returns (X, feature_order, errors) where errors maps the index of every
+    patient that could not be encoded to a reason. Those rows are left out
+    of X, so X has len(patients) - len(errors) rows in input order.
+    """
+    bundle = bundle or current_bundle()
+    X, errors = encode_records(patients, bundle.encoding_plan, unseen_category_code)
+    return X, bundle.feature_order, errors
+
 
-    processed = {}
+def explain_matrix(X, bundle=None):
+    """SHAP values for every row of X (zeros when shap is unavailable)."""
+    bundle = bundle or current_bundle()
+    try:
+        return np.asarray(bundle.explainer.shap_values(X))
+    except Exception:
+        # shap may fail for some models or versions; fall back to zeros
+        return np.zeros(X.shape)
 
-    for col in feature_order:
-        if col in encoders:  # categorical columns
-            processed[col] = encoders[col].transform([patient[col]])[0]
-        else:  # numeric columns
-            processed[col] = float(patient[col])
 
-    X = np.array([[processed[col] for col in feature_order]])
-    return X, feature_order
+def top_factors(feature_names, shap_row, k: int = 5):
+    pairs = zip(feature_names, shap_row)
+    top = sorted(pairs, key=lambda x: abs(x[1]), reverse=True)[:k]
+    return [{"feature": f, "impact": float(v)} for f, v in top]
 
 
 
 # ---------------------------------------------------------
 # Fetch patient data (DB → CSV fallback)
 # ---------------------------------------------------------
-async def fetch_from_db(patient_id: str):
-    try:
-        conn = await asyncpg.connect(
-            user="postgres",
-            password="RadheRadhe",
-            host="localhost",
-            database="radiology"
-        )
+# Constant SQL text → asyncpg prepares it once per pooled connection and
+# reuses the prepared statement from its statement cache on every call.
+LATEST_RECORD_SQL = """
+    SELECT *
+    FROM imaging_results
+    WHERE patient_id = $1
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
 
-        row = await conn.fetchrow("""
-            SELECT *
-            FROM imaging_results
-            WHERE patient_id = $1
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, patient_id)
+LATEST_RECORDS_SQL = """
+    SELECT DISTINCT ON (patient_id) *
+    FROM imaging_results
+    WHERE patient_id = ANY($1::text[])
+    ORDER BY patient_id, created_at DESC
+"""
+
+# Short-lived cache of DB lookups (including "not in DB" answers) so repeat
+# predictions for the same patient skip the database entirely.
+patient_record_cache = TTLCache(
+    maxsize=int(os.getenv("PATIENT_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("PATIENT_CACHE_TTL", "30")),
+)
+
+
+async def fetch_from_db(patient_id: str):
+    hit, record = patient_record_cache.lookup(patient_id)
+    if hit:
+        return dict(record) if record else None
 
-        await conn.close()
+    try:
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            row = await con.fetchrow(LATEST_RECORD_SQL, patient_id)
 
-        return dict(row) if row else None
+        record = dict(row) if row else None
+        patient_record_cache.set(patient_id, record)
+        return dict(record) if record else None
 
     except Exception as e:
         print("DB fetch error:", e)
         return None
 
 
+async def fetch_many_from_db(patient_ids):
+    """Latest DB record for every id in ONE query. Returns {patient_id: record}."""
+    found, pending = {}, []
+    for patient_id in patient_ids:
+        hit, record = patient_record_cache.lookup(patient_id)
+        if not hit:
+            pending.append(patient_id)
+        elif record:
+            found[patient_id] = dict(record)
+
+    if not pending:
+        return found
+
+    try:
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            rows = await con.fetch(LATEST_RECORDS_SQL, pending)
+
+        fetched = {row["patient_id"]: dict(row) for row in rows}
+        for patient_id in pending:
+            record = fetched.get(patient_id)
+            patient_record_cache.set(patient_id, record)
+            if record:
+                found[patient_id] = dict(record)
+
+    except Exception as e:
+        print("DB batch fetch error:", e)
+
+    return found
+
+
 def fetch_from_csv(patient_id: str):
-    row = dataset_df[dataset_df["patient_id"] == patient_id]
-    return None if row.empty else row.iloc[0].to_dict()
+    return patient_index.get(patient_id)
 
 
-async def get_patient_data(patient_id: str):
+async def get_patient_record(patient_id: str):
+    """Returns (record, source) where source is "db" or "csv"."""
     record = await fetch_from_db(patient_id)
     if record:
         print("✨ Loaded from DATABASE")
-        return record
+        return record, "db"
 
     record = fetch_from_csv(patient_id)
     if record:
         print("✨ Loaded from CSV")
-        return record
+        return record, "csv"
 
     raise HTTPException(404, f"Patient {patient_id} not found in DB or dataset.")
 
 
+async def get_patient_data(patient_id: str):
+    record, _ = await get_patient_record(patient_id)
+    return record
+
+
+# ---------------------------------------------------------
+# Precomputed risk table for the CSV dataset
+# ---------------------------------------------------------
+# The CSV is static for the life of the process, so every CSV patient is
+# scored ONCE (one matrix, one predict / SHAP pass) in the background after
+# startup. The table is tied to the CSV + model file mtimes and is rebuilt
+# when either file changes.
+risk_table = {}               # patient_id -> {"prediction", "probability", "top_factors"}
+risk_table_signature = None
+cohort_summary = None         # population view built in the same pass (see /cohort/risk)
+_risk_table_lock = threading.Lock()
+
+COHORT_HISTOGRAM_BINS = 10
+COHORT_GROUP_COLUMNS = ("age_group", "gender", "smoking_status")
+
+
+def risk_source_signature():
+    """(CSV mtime, active model version signature) — the table is stale when either moves."""
+    try:
+        csv_mtime = os.path.getmtime(DATASET_CSV_PATH)
+    except OSError:
+        csv_mtime = None
+    bundle = current_bundle()
+    return (csv_mtime, bundle.signature if bundle else None)
+
+
+def summarize_cohort(patients, feature_names, pred_classes, pred_probas, shap_matrix):
+    """Risk histogram, mean |SHAP| per feature and risk by group for the scored patients."""
+    probas = np.asarray(pred_probas, dtype=float)
+    classes = np.asarray(pred_classes, dtype=int)
+
+    counts, edges = np.histogram(probas, bins=COHORT_HISTOGRAM_BINS, range=(0.0, 1.0))
+    mean_abs_shap = np.abs(shap_matrix).mean(axis=0)
+    importance = sorted(
+        zip(feature_names, mean_abs_shap.tolist()), key=lambda x: x[1], reverse=True
+    )
+
+    frame = pd.DataFrame({
+        **{col: [str(p.get(col)) for p in patients] for col in COHORT_GROUP_COLUMNS},
+        "probability": probas,
+        "urgent": classes,
+    })
+    by_group = {}
+    for col in COHORT_GROUP_COLUMNS:
+        stats = frame.groupby(col, sort=True).agg(
+            patients=("probability", "size"),
+            mean_probability=("probability", "mean"),
+            urgent_rate=("urgent", "mean"),
+        )
+        by_group[col] = [
+            {
+                "value": value,
+                "patients": int(row.patients),
+                "mean_probability": float(row.mean_probability),
+                "urgent_rate": float(row.urgent_rate),
+            }
+            for value, row in stats.iterrows()
+        ]
+
+    return {
+        "patients": int(len(probas)),
+        "mean_probability": float(probas.mean()) if len(probas) else None,
+        "urgent_rate": float(classes.mean()) if len(classes) else None,
+        "histogram": {
+            "bin_edges": [round(float(e), 4) for e in edges],
+            "counts": counts.tolist(),
+        },
+        "feature_importance": [
+            {"feature": f, "mean_abs_shap": float(v)} for f, v in importance
+        ],
+        "by_group": by_group,
+    }
+
+
+def build_risk_table():
+    """Score every CSV patient in one pass and publish the results."""
+    global risk_table, risk_table_signature, cohort_summary
+
+    with _risk_table_lock:
+        signature = risk_source_signature()
+        if signature == risk_table_signature:
+            return risk_table
+
+        if not ensure_model_loaded():
+            print("Risk table skipped, model not available:", MODEL_LOAD_ERROR)
+            return risk_table
+
+        # The CSV itself changed on disk → reload it (and its indexes) before scoring
+        reload_dataset_if_changed()
+
+        # Score with one bundle and tag the table with exactly that version
+        bundle = current_bundle()
+        signature = risk_source_signature()
+
+        started = time.perf_counter()
+        table = {}
+        summary = None
+
+        if not dataset_df.empty:
+            patients = [fill_patient_defaults(r) for r in dataset_df.to_dict("records")]
+            X, feature_names, errors = preprocess_batch(patients, bundle)
+            scored = [p for i, p in enumerate(patients) if i not in errors]
+
+            if scored:
+                pred_classes, pred_probas = predict_class_and_proba(bundle.model, X)
+                shap_matrix = explain_matrix(X, bundle)
+
+                for row, patient in enumerate(scored):
+                    table[patient["patient_id"]] = {
+                        "prediction": int(pred_classes[row]),
+                        "probability": float(pred_probas[row]),
+                        "top_factors": top_factors(feature_names, shap_matrix[row]),
+                    }
+
+                summary = summarize_cohort(scored, feature_names, pred_classes, pred_probas, shap_matrix)
+                summary["model_version"] = bundle.version
+
+        risk_table = table
+        cohort_summary = summary
+        risk_table_signature = signature
+        print(f"✅ Risk table built: {len(table)} patients in {time.perf_counter() - started:.2f}s")
+        return risk_table
+
+
+def refresh_risk_table_in_background():
+    """Kick off build_risk_table on a daemon thread unless one is already running."""
+    if _risk_table_lock.locked():
+        return
+    threading.Thread(target=build_risk_table, name="risk-table", daemon=True).start()
+
+
+def cached_risk(patient_id: str, bundle=None):
+    """Precomputed result for a CSV patient, or None if missing / stale / from another model version."""
+    signature = risk_source_signature()
+    if risk_table_signature != signature:
+        refresh_risk_table_in_background()
+        return None
+    if bundle is not None and signature[1] != bundle.signature:
+        return None
+    return risk_table.get(patient_id)
+
+
 # ---------------------------------------------------------
 # GPT-4o INSIGHT GENERATOR
 # ---------------------------------------------------------
-def generate_llm_insight(patient, shap_factors, pred_class, prob):
+# Insights keyed on a hash of the prompt inputs; set INSIGHT_CACHE_PATH to a
+# SQLite file to keep them across restarts.
+insight_cache = InsightCache(
+    maxsize=int(os.getenv("INSIGHT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("INSIGHT_CACHE_TTL", "86400")),
+    path=os.getenv("INSIGHT_CACHE_PATH"),
+)
 
-    prompt = f"""
+
+def insight_model_candidates():
+    # Try a list of models in order, fall back if one is unavailable
+    return [m.strip() for m in os.getenv("INSIGHT_MODELS", "gpt-4o,gpt-4,gpt-3.5-turbo").split(",") if m.strip()]
+
+
+def build_insight_prompt(patient, shap_factors, pred_class, prob):
+    return f"""
 You are a friendly medical assistant. Explain the patient’s risk in simple English.
 
 PATIENT:
@@ -187,62 +548,180 @@ Write 4–6 short, clear, human-style bullet points.
 Avoid technical ML terms.
 """
 
-    # Try a list of models in order, fall back if one is unavailable
-    model_candidates = [m.strip() for m in os.getenv("INSIGHT_MODELS", "gpt-4o,gpt-4,gpt-3.5-turbo").split(",") if m.strip()]
+
+def insight_messages(prompt):
+    return [
+        {"role": "system", "content": "You explain medical risk in simple language."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def insight_breaker(model_name):
+    return get_breaker(f"insight:{model_name}")
+
+
+def record_insight_model_error(model_name, e):
+    unavailable = is_model_unavailable_error(e)
+    # Model missing / no access → open its breaker right away; transient API
+    # errors open it after LLM_BREAKER_FAILURES in a row; input errors never do
+    insight_breaker(model_name).record_error(e)
+
+    # If the error indicates the model is not found or unavailable, try the next model
+    if unavailable:
+        print(f"Model {model_name} not available, trying next model: {e}")
+    else:
+        # For other transient errors, log and try next model as well
+        print(f"Error calling model {model_name}, trying next: {e}")
+
+
+def fallback_insight(shap_factors):
+    bullets = []
+    for f in shap_factors[:6]:
+        bullets.append(f"{f['feature']}: impact {f['impact']:.3f}")
+
+    return (
+        "Summary generation service is unavailable. "
+        "Key factors: " + "; ".join(bullets)
+    )
+
+
+def generate_llm_insight(patient, shap_factors, pred_class, prob):
+
+    model_candidates = insight_model_candidates()
+
+    cache_key = insight_cache_key(patient, shap_factors, pred_class, prob, ",".join(model_candidates))
+    cached = insight_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = build_insight_prompt(patient, shap_factors, pred_class, prob)
 
     last_error = None
     for model_name in model_candidates:
+        # Skip models whose circuit breaker is open
+        if not insight_breaker(model_name).allow():
+            continue
         try:
             response = client.chat.completions.create(
                 model=model_name,
-                messages=[
-                    {"role": "system", "content": "You explain medical risk in simple language."},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=insight_messages(prompt),
             )
 
             # Different SDKs may return content in slightly different shapes
             try:
-                return response.choices[0].message.content
+                text = response.choices[0].message.content
             except Exception:
                 try:
-                    return response.choices[0].text
+                    text = response.choices[0].text
                 except Exception:
-                    return str(response)
+                    text = str(response)
+
+            insight_breaker(model_name).record_success()
+
+            # Only real model output is cached, never the fallback below
+            if text:
+                insight_cache.set(cache_key, text)
+            return text
 
         except Exception as e:
             last_error = e
-            msg = str(e).lower()
-            # If the error indicates the model is not found or unavailable, try the next model
-            if "model" in msg and ("not" in msg or "does not" in msg or "model_not_found" in msg):
-                print(f"Model {model_name} not available, trying next model: {e}")
-                continue
-            # For other transient errors, log and try next model as well
-            print(f"Error calling model {model_name}, trying next: {e}")
+            record_insight_model_error(model_name, e)
             continue
 
     # If we reach here, all models failed — degrade gracefully
     print("LLM insight generation failed for all candidate models; returning fallback summary.", last_error)
-    bullets = []
-    for f in shap_factors[:6]:
-        bullets.append(f"{f['feature']}: impact {f['impact']:.3f}")
+    return fallback_insight(shap_factors)
 
-    fallback = (
-        "Summary generation service is unavailable. "
-        "Key factors: " + "; ".join(bullets)
-    )
-    return fallback
+
+async def stream_llm_insight(patient, shap_factors, pred_class, prob):
+    """
+    Same as generate_llm_insight but yields the summary as text chunks while
+    the model produces them. Async generator on the AsyncOpenAI client, so it
+    runs on the event loop without holding a worker thread.
+    """
+    model_candidates = insight_model_candidates()
+
+    cache_key = insight_cache_key(patient, shap_factors, pred_class, prob, ",".join(model_candidates))
+    cached = insight_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    prompt = build_insight_prompt(patient, shap_factors, pred_class, prob)
+
+    last_error = None
+    for model_name in model_candidates:
+        if not insight_breaker(model_name).allow():
+            continue
+        parts = []
+        try:
+            stream = await get_async_client().chat.completions.create(
+                model=model_name,
+                messages=insight_messages(prompt),
+                stream=True,
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+            insight_breaker(model_name).record_success()
+            text = "".join(parts)
+            if text:
+                insight_cache.set(cache_key, text)
+            return
+
+        except Exception as e:
+            last_error = e
+            if parts:
+                # Text already reached the client; a different model can't continue it
+                insight_breaker(model_name).record_error(e)
+                print(f"Streaming from model {model_name} broke off:", e)
+                return
+            record_insight_model_error(model_name, e)
+            continue
+
+    print("LLM insight streaming failed for all candidate models; returning fallback summary.", last_error)
+    yield fallback_insight(shap_factors)
+
+
+# ---------------------------------------------------------
+# Missing-field defaults (shared by single + batch prediction)
+# ---------------------------------------------------------
+DEFAULT_PATIENT_VALUES = {
+    "age": 0,
+    "gender": "Unknown",
+    "BMI": 0,
+    "diabetes": 0,
+    "hypertension": 0,
+    "smoking_status": "never",
+    "heart_disease": 0,
+    "patients_visited": 1,
+    "target_urgent_followup": 0,
+}
+
+
+def fill_patient_defaults(patient: dict):
+    """Fill missing required fields in place so the model always gets complete data."""
+    for key, value in DEFAULT_PATIENT_VALUES.items():
+        patient.setdefault(key, value)
+
+    # Auto-create age_group (required by model)
+    if "age_group" not in patient:
+        patient["age_group"] = age_group_for(patient.get("age", 0))
+
+    return patient
 
 
 # ---------------------------------------------------------
 # Prediction Endpoint
 # ---------------------------------------------------------
-@router.post("/predict-risk")
-async def predict_risk(payload: dict):
+async def score_patient_request(payload: dict):
     """
-    Prediction endpoint using ONLY patient_id.
-    Backend automatically loads patient record from DB or CSV.
-    Missing features are auto-filled so model always receives complete data.
+    Steps shared by /predict-risk and /predict-risk/stream: validate the id,
+    load the record, fill defaults, then predict + explain (or read the
+    precomputed risk table). Raises HTTPException on bad input.
     """
 
     # -------------------------------
@@ -255,92 +734,401 @@ async def predict_risk(payload: dict):
     # -------------------------------
     # 2️⃣ Fetch patient record
     # -------------------------------
-    patient = await get_patient_data(patient_id)
+    patient, source = await get_patient_record(patient_id)
     if not patient:
         raise HTTPException(404, f"Patient {patient_id} not found")
 
     # -------------------------------
     # 3️⃣ Auto-fill missing required fields
     # -------------------------------
-    default_values = {
-        "age": 0,
-        "gender": "Unknown",
-        "BMI": 0,
-        "diabetes": 0,
-        "hypertension": 0,
-        "smoking_status": "never",
-        "heart_disease": 0,
-        "patients_visited": 1,
-        "target_urgent_followup": 0,
-    }
+    fill_patient_defaults(patient)
 
-    # Merge defaults into patient dict
-    for key, value in default_values.items():
-        patient.setdefault(key, value)
+    if not ensure_model_loaded():
+        raise HTTPException(503, f"Model not available: {MODEL_LOAD_ERROR}")
+    bundle = current_bundle()
 
-    # ---------------------------------------
-    # Auto-create age_group (required by model)
-    # ---------------------------------------
-    if "age_group" not in patient:
-        age = int(patient.get("age", 0))
-        if age < 40:
-            patient["age_group"] = "20-40"
-        elif age <= 60:
-            patient["age_group"] = "40-60"
-        else:
-            patient["age_group"] = "60+"
+    # CSV patients are already scored in the precomputed risk table
+    cached = cached_risk(patient_id, bundle) if source == "csv" else None
+
+    if cached:
+        pred_class = cached["prediction"]
+        pred_proba = cached["probability"]
+        shap_output = cached["top_factors"]
+    else:
+        # -------------------------------
+        # 4️⃣ Preprocess for model
+        # -------------------------------
+        try:
+            X, feature_names = preprocess(patient, bundle)
+        except ValueError as e:
+            raise HTTPException(422, f"Cannot encode patient {patient_id}: {e}")
+
+        # -------------------------------
+        # 5️⃣ Model Prediction + 6️⃣ SHAP explanation
+        # (inference pool, micro-batched with concurrent requests)
+        # -------------------------------
+        pred_class, pred_proba, shap_row = await micro_batcher.score_row(bundle, X)
+        pred_class = int(pred_class)
+        pred_proba = float(pred_proba)
+        shap_output = top_factors(feature_names, shap_row)
+
+    return {
+        "patient_data": patient,
+        "prediction": pred_class,
+        "probability": pred_proba,
+        "top_factors": shap_output,
+        "model_version": bundle.version,
+    }
 
 
+@router.post("/predict-risk")
+async def predict_risk(payload: dict):
+    """
+    Prediction endpoint using ONLY patient_id.
+    Backend automatically loads patient record from DB or CSV.
+    Missing features are auto-filled so model always receives complete data.
+    """
+    result = await score_patient_request(payload)
 
+    # -------------------------------
+    # 7️⃣ GPT Summary (blocking OpenAI call → worker thread)
+    # -------------------------------
+    insight_text = await asyncio.to_thread(
+        generate_llm_insight,
+        result["patient_data"],
+        result["top_factors"],
+        result["prediction"],
+        result["probability"],
+    )
 
     # -------------------------------
-    # 4️⃣ Preprocess for model
+    # 8️⃣ Final Response
     # -------------------------------
-    # Ensure model is loaded before running predictions
+    return {
+        **result,
+        "summary": insight_text,
+        "bullets": [],
+    }
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@router.post("/predict-risk/stream")
+async def predict_risk_stream(payload: dict):
+    """
+    Streaming variant of /predict-risk (Server-Sent Events).
+
+    event: prediction → {patient_data, prediction, probability, top_factors}
+                        sent as soon as the model result is ready
+    event: summary    → {"delta": "..."} chunks of the LLM summary as they arrive
+    event: done       → {"summary": "<full text>"}
+
+    Validation / lookup errors are raised before the stream starts, so they
+    still come back as normal HTTP errors.
+    """
+    result = await score_patient_request(payload)
+
+    # Async generator over the async OpenAI stream: each open stream is a
+    # coroutine, so many of them never exhaust the threadpool the sync routes use
+    async def events():
+        yield sse_event("prediction", result)
+
+        parts = []
+        async for delta in stream_llm_insight(
+            result["patient_data"],
+            result["top_factors"],
+            result["prediction"],
+            result["probability"],
+        ):
+            parts.append(delta)
+            yield sse_event("summary", {"delta": delta})
+
+        yield sse_event("done", {"summary": "".join(parts)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------------------------------------------------------
+# Batch Prediction Endpoint
+# ---------------------------------------------------------
+PREDICT_BATCH_MAX = int(os.getenv("PREDICT_BATCH_MAX", "5000"))
+
+
+@router.post("/predict-risk/batch")
+async def predict_risk_batch(payload: dict):
+    """
+    Score many patients in one call.
+
+    Body: {"patient_ids": [...], "include_summary": false}
+
+    Records are fetched in bulk, encoded into ONE feature matrix, and
+    predict / predict_proba / SHAP each run once over the whole matrix.
+    The LLM summary is skipped unless include_summary is true.
+    Unknown or unencodable patients get an "error" entry instead of
+    failing the whole batch.
+    """
+    patient_ids = payload.get("patient_ids")
+    if not isinstance(patient_ids, list) or not patient_ids:
+        raise HTTPException(400, "patient_ids must be a non-empty list")
+    if len(patient_ids) > PREDICT_BATCH_MAX:
+        raise HTTPException(400, f"At most {PREDICT_BATCH_MAX} patient_ids per batch")
+    if not all(isinstance(pid, str) and pid.strip() for pid in patient_ids):
+        raise HTTPException(400, "patient_ids must be non-empty strings")
+
+    include_summary = bool(payload.get("include_summary", False))
+
     if not ensure_model_loaded():
         raise HTTPException(503, f"Model not available: {MODEL_LOAD_ERROR}")
+    bundle = current_bundle()
+
+    # -------------------------------
+    # 1️⃣ Fetch records (one DB round trip, CSV for the rest)
+    # -------------------------------
+    db_records = await fetch_many_from_db(set(patient_ids))
+
+    results = [None] * len(patient_ids)
+    patients, positions = [], []
+    summary_positions = []
+    for pos, patient_id in enumerate(patient_ids):
+        record = db_records.get(patient_id)
+        from_csv = record is None
+        if from_csv:
+            record = fetch_from_csv(patient_id)
+        if not record:
+            results[pos] = {"patient_id": patient_id, "error": "Patient not found in DB or dataset."}
+            continue
+
+        try:
+            patient = fill_patient_defaults(dict(record))
+        except (TypeError, ValueError):
+            results[pos] = {"patient_id": patient_id, "error": f"Invalid age: {record.get('age')!r}"}
+            continue
+        cached = cached_risk(patient_id, bundle) if from_csv else None
+        if cached:
+            results[pos] = {"patient_id": patient_id, "patient_data": patient, **cached}
+            summary_positions.append(pos)
+            continue
 
-    X, feature_names = preprocess(patient)
+        patients.append(patient)
+        positions.append(pos)
 
     # -------------------------------
-    # 5️⃣ Model Prediction
+    # 2️⃣ One matrix → one predict / predict_proba / SHAP call
     # -------------------------------
-    pred_class = int(model.predict(X)[0])
-    pred_proba = float(model.predict_proba(X)[0][1])
+    X, feature_names, errors = preprocess_batch(patients, bundle)
+    for i, reason in errors.items():
+        results[positions[i]] = {"patient_id": patient_ids[positions[i]], "error": reason}
+
+    scored = [(positions[i], p) for i, p in enumerate(patients) if i not in errors]
+    summary_positions.extend(pos for pos, _ in scored)
+
+    if scored:
+        pred_classes, pred_probas, shap_matrix = await inference_executor.score(bundle, X)
+
+        for row, (pos, patient) in enumerate(scored):
+            results[pos] = {
+                "patient_id": patient_ids[pos],
+                "patient_data": patient,
+                "prediction": int(pred_classes[row]),
+                "probability": float(pred_probas[row]),
+                "top_factors": top_factors(feature_names, shap_matrix[row]),
+            }
 
     # -------------------------------
-    # 6️⃣ SHAP explanation
+    # 3️⃣ Optional GPT summaries (off the event loop)
     # -------------------------------
-    try:
-        shap_values = explainer.shap_values(X)
-        shap_row = shap_values[0]
-    except Exception:
-        # shap may fail for some models or versions; fall back to zeros
-        shap_row = [0.0] * len(feature_names)
+    if include_summary and summary_positions:
+        summaries = await asyncio.gather(*[
+            asyncio.to_thread(
+                generate_llm_insight,
+                results[pos]["patient_data"],
+                results[pos]["top_factors"],
+                results[pos]["prediction"],
+                results[pos]["probability"],
+            )
+            for pos in summary_positions
+        ])
+        for pos, summary in zip(summary_positions, summaries):
+            results[pos]["summary"] = summary
 
-    pairs = zip(feature_names, shap_row)
-    top_five = sorted(pairs, key=lambda x: abs(x[1]), reverse=True)[:5]
-    shap_output = [{"feature": f, "impact": float(v)} for f, v in top_five]
+    return {
+        "count": len(results),
+        "scored": len(summary_positions),
+        "model_version": bundle.version,
+        "results": results,
+    }
+
+
+# ---------------------------------------------------------
+# What-if (counterfactual) Endpoint
+# ---------------------------------------------------------
+WHATIF_MAX_SCENARIOS = int(os.getenv("WHATIF_MAX_SCENARIOS", "5000"))
+WHATIF_FIXED_FEATURES = {"patient_id", "Patients_Name"}
+
+
+def scenario_values(feature, spec):
+    """Alternatives for one feature: a list, or {"min", "max", "step"} for numeric features."""
+    if isinstance(spec, list):
+        if len(spec) > WHATIF_MAX_SCENARIOS:
+            raise HTTPException(400, f"{feature}: more than {WHATIF_MAX_SCENARIOS} values")
+        values = spec
+    elif isinstance(spec, dict) and {"min", "max"} <= spec.keys():
+        try:
+            step = float(spec.get("step", 1))
+            start, stop = float(spec["min"]), float(spec["max"])
+        except (TypeError, ValueError):
+            raise HTTPException(400, f"{feature}: min, max and step must be numbers")
+        if not all(math.isfinite(x) for x in (start, stop, step)):
+            raise HTTPException(400, f"{feature}: min, max and step must be finite")
+        if step <= 0:
+            raise HTTPException(400, f"{feature}: step must be positive")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        if count < 1:
+            raise HTTPException(400, f"{feature}: max must be >= min")
+        if count > WHATIF_MAX_SCENARIOS:
+            raise HTTPException(400, f"{feature}: range produces more than {WHATIF_MAX_SCENARIOS} values")
+        values = [round(start + i * step, 6) for i in range(count)]
+    else:
+        raise HTTPException(400, f"{feature}: expected a list of values or {{min, max, step}}")
+
+    if not values:
+        raise HTTPException(400, f"{feature}: no values given")
+    return values
+
+
+def check_scenario_items(feature, values, bundle):
+    """400 unless every alternative fits the column: a finite number for numeric
+    features, a scalar (str / number / bool) for categorical ones."""
+    numeric = dict(bundle.encoding_plan)[feature] is None
+    for value in values:
+        if numeric:
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+        else:
+            ok = isinstance(value, (str, int, float, bool))
+        if not ok:
+            kind = "numbers" if numeric else "strings, numbers or booleans"
+            raise HTTPException(400, f"{feature}: values must be {kind}, got {value!r}")
+
+
+def encode_column(col, values, bundle):
+    """Encode one feature's values with the encoding plan (same rules as preprocess)."""
+    lookup = dict(bundle.encoding_plan)[col]
+    if lookup is None:
+        return np.asarray(values, dtype=float)
+    codes = []
+    for value in values:
+        code = lookup.get(value)
+        codes.append(unseen_category_code(col, value) if code is None else code)
+    return np.asarray(codes, dtype=float)
+
+
+@router.post("/predict-risk/what-if")
+async def predict_risk_what_if(payload: dict):
+    """
+    Counterfactual risk surface for one patient. No SHAP, no LLM.
+
+    Body: {"patient_id": "...", "scenarios": {"BMI": {"min": 22, "max": 32, "step": 2},
+                                              "smoking_status": ["never", "former"]}}
+
+    The patient is encoded once with preprocess, the row is tiled over the
+    cartesian grid of alternatives, and only the varied columns are
+    re-encoded. The baseline plus every scenario is scored in ONE
+    predict_proba call. Changing age also moves age_group unless age_group
+    is itself varied.
+    """
+    patient_id = payload.get("patient_id")
+    if not patient_id:
+        raise HTTPException(400, "patient_id is required")
+
+    spec = payload.get("scenarios")
+    if not isinstance(spec, dict) or not spec:
+        raise HTTPException(400, "scenarios must map feature names to alternatives")
+
+    if not ensure_model_loaded():
+        raise HTTPException(503, f"Model not available: {MODEL_LOAD_ERROR}")
+    bundle = current_bundle()
+    feature_order = bundle.feature_order
+
+    for feature in spec:
+        if feature not in feature_order:
+            raise HTTPException(400, f"Unknown feature: {feature}")
+        if feature in WHATIF_FIXED_FEATURES:
+            raise HTTPException(400, f"{feature} cannot be varied")
+
+    patient, _ = await get_patient_record(patient_id)
+    if not patient:
+        raise HTTPException(404, f"Patient {patient_id} not found")
+    fill_patient_defaults(patient)
+
+    features = list(spec)
+    axes = {feature: scenario_values(feature, spec[feature]) for feature in features}
+    for feature, values in axes.items():
+        check_scenario_items(feature, values, bundle)
+    # math.prod on Python ints: np.prod would wrap around int64 on large grids
+    grid_size = math.prod(len(v) for v in axes.values())
+    if grid_size > WHATIF_MAX_SCENARIOS:
+        raise HTTPException(400, f"{grid_size} scenarios requested, at most {WHATIF_MAX_SCENARIOS} allowed")
 
     # -------------------------------
-    # 7️⃣ GPT Summary
+    # 1️⃣ Scenario matrix: baseline row tiled, varied columns overwritten
     # -------------------------------
-    insight_text = generate_llm_insight(patient, shap_output, pred_class, pred_proba)
+    try:
+        base_row, feature_names = preprocess(patient, bundle)
+        grid = np.array(np.meshgrid(*[np.arange(len(axes[f])) for f in features], indexing="ij"))
+        grid = grid.reshape(len(features), -1)   # per feature: value index of each scenario
+
+        X = np.repeat(base_row, grid_size + 1, axis=0)   # row 0 stays the baseline
+        for k, feature in enumerate(features):
+            values = [axes[feature][i] for i in grid[k]]
+            X[1:, feature_order.index(feature)] = encode_column(feature, values, bundle)
+
+        if "age" in axes and "age_group" not in axes:
+            ages = [axes["age"][i] for i in grid[features.index("age")]]
+            X[1:, feature_order.index("age_group")] = encode_column(
+                "age_group", [age_group_for(a) for a in ages], bundle
+            )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(422, f"Cannot encode scenario: {e}")
 
     # -------------------------------
-    # 8️⃣ Final Response
+    # 2️⃣ One predict_proba call for baseline + every scenario
     # -------------------------------
+    pred_classes, pred_probas, _ = await inference_executor.score(bundle, X, explain=False)
+    baseline_proba = float(pred_probas[0])
+
+    scenarios = [
+        {
+            "changes": {f: axes[f][grid[k, s]] for k, f in enumerate(features)},
+            "prediction": int(pred_classes[s + 1]),
+            "probability": float(pred_probas[s + 1]),
+            "delta": float(pred_probas[s + 1]) - baseline_proba,
+        }
+        for s in range(grid_size)
+    ]
+
     return {
-        "patient_data": patient,
-        "prediction": pred_class,
-        "probability": pred_proba,
-        "top_factors": shap_output,
-        "summary": insight_text,
-        "bullets": [],
+        "patient_id": patient_id,
+        "model_version": bundle.version,
+        "baseline": {
+            "patient_data": patient,
+            "prediction": int(pred_classes[0]),
+            "probability": baseline_proba,
+        },
+        "axes": axes,
+        "count": grid_size,
+        "scenarios": scenarios,
+        "lowest_risk": min(scenarios, key=lambda x: x["probability"]),
     }
 
 
 
+
 # from pathlib import Path
 # import json
 
@@ -350,12 +1138,56 @@ async def predict_risk(payload: dict):
 #     MODEL_METRICS = json.load(f)
 
 
+@router.get("/insight-cache/stats")
+def get_insight_cache_stats():
+    return insight_cache.stats()
+
+
 @router.get("/model-metrics")
 def get_model_metrics():
+    # Metrics of the version actually serving (shipped with its artifacts)
+    bundle = current_bundle()
+    metrics = bundle.metrics if bundle else MODEL_METRICS
     try:
-        return {"accuracy": float(MODEL_METRICS.get("accuracy"))}
+        accuracy = float(metrics.get("accuracy"))
     except:
-        return {"accuracy": None}
+        accuracy = None
+    return {
+        "accuracy": accuracy,
+        "model_version": bundle.version if bundle else None,
+    }
+
+
+@router.get("/inference/stats")
+def get_inference_stats():
+    return {
+        "executor": inference_executor.kind,
+        "workers": inference_executor.workers,
+        "micro_batching": micro_batcher.stats(),
+    }
+
+
+@router.get("/model-registry")
+def get_model_registry():
+    return model_registry.status()
+
+
+@router.get("/cohort/risk")
+async def get_cohort_risk():
+    """
+    Population risk view over the whole dataset: risk histogram, mean |SHAP|
+    per feature and risk by age_group / gender / smoking_status. Computed in
+    the same vectorized pass as the risk table, so it is cached until the
+    dataset or model artifact changes.
+    """
+    if cohort_summary is None or risk_table_signature != risk_source_signature():
+        await asyncio.to_thread(build_risk_table)
+
+    if cohort_summary is None:
+        if MODEL_LOAD_ERROR:
+            raise HTTPException(503, f"Model not available: {MODEL_LOAD_ERROR}")
+        raise HTTPException(503, "Cohort risk not available: dataset is empty")
+    return cohort_summary
 
 
 
@@ -393,10 +1225,22 @@ def get_model_metrics():
 
 
 
+VISITS_PAGE_MAX = 5000
+
+
 @router.get("/patients/by-visits")
-async def get_patients_by_visits(count: int):
+async def get_patients_by_visits(
+    count: Optional[int] = None,
+    min_visits: Optional[int] = None,
+    max_visits: Optional[int] = None,
+    limit: int = 500,
+    cursor: int = 0,
+):
     """
-    Returns patients who have visited exactly `count` times.
+    Returns patients who have visited exactly `count` times, or between
+    `min_visits` and `max_visits` (inclusive, either bound optional).
+    Paginated: pass the returned `next_cursor` back as `cursor` for the next
+    page (null on the last page). Served from the precomputed visit buckets.
     Works even if dataset or column is missing.
     """
 
@@ -407,14 +1251,7 @@ async def get_patients_by_visits(count: int):
             "warning": "Dataset not available"
         }
 
-    # Detect correct column name safely
-    visit_col = None
-    if "patients_visited" in dataset_df.columns:
-        visit_col = "patients_visited"
-    elif "visit_count" in dataset_df.columns:
-        visit_col = "visit_count"
-
-    if visit_col is None:
+    if visit_buckets is None:
         return {
             "requested_count": count,
             "patients": [],
@@ -422,21 +1259,20 @@ async def get_patients_by_visits(count: int):
             "available_columns": list(dataset_df.columns)
         }
 
-    try:
-        filtered = dataset_df[dataset_df[visit_col] == count]
+    if count is not None:
+        min_visits = max_visits = count
+    limit = max(1, min(limit, VISITS_PAGE_MAX))
 
-        result = [
-            {
-                "patient_id": row.get("patient_id"),
-                "patient_name": row.get("Patients_Name", "Unknown"),
-                "visit_count": int(row[visit_col]),
-            }
-            for _, row in filtered.iterrows()
-        ]
+    try:
+        patients, total, next_cursor = visit_buckets.query(min_visits, max_visits, cursor, limit)
 
         return {
             "requested_count": count,
-            "patients": result
+            "min_visits": min_visits,
+            "max_visits": max_visits,
+            "total": total,
+            "next_cursor": next_cursor,
+            "patients": patients
         }
 
     except Exception as e:
@@ -517,7 +1353,8 @@ async def search_patients(q: str, limit: int = 10):
     """
     Smart patient search:
     - Number → search by visit count
-    - Text → search by patient name
+    - Text → ranked name search (prefix, word prefix, substring, typo-tolerant)
+      served from the in-memory index built at dataset load
     """
 
     if dataset_df is None or dataset_df.empty:
@@ -528,55 +1365,34 @@ async def search_patients(q: str, limit: int = 10):
         }
 
     q = q.strip()
+    limit = max(0, min(limit, 100))
 
     try:
         # -------------------------------
         # Case 1: Visit count search
         # -------------------------------
         if q.isdigit():
-            visit_count = int(q)
-
-            visit_col = (
-                "patients_visited"
-                if "patients_visited" in dataset_df.columns
-                else "visit_count"
-                if "visit_count" in dataset_df.columns
-                else None
-            )
-
-            if visit_col is None:
+            if visit_buckets is None:
                 return {
                     "query": q,
                     "patients": [],
                     "error": "Visit count column not found"
                 }
 
-            filtered = dataset_df[dataset_df[visit_col] == visit_count]
+            result, _, _ = visit_buckets.query(int(q), int(q), 0, limit)
 
         # -------------------------------
         # Case 2: Name search
         # -------------------------------
         else:
-            if "Patients_Name" not in dataset_df.columns:
+            if not patient_search.has_names:
                 return {
                     "query": q,
                     "patients": [],
                     "error": "Patient name column not found"
                 }
 
-            filtered = dataset_df[
-                dataset_df["Patients_Name"]
-                .str.contains(q, case=False, na=False)
-            ]
-
-        result = [
-            {
-                "patient_id": row.get("patient_id"),
-                "patient_name": row.get("Patients_Name", "Unknown"),
-                "visit_count": row.get("patients_visited", row.get("visit_count")),
-            }
-            for _, row in filtered.head(limit).iterrows()
-        ]
+            result = patient_search.search(q, limit)
 
         return {
             "query": q,
@@ -0,0 +1,187 @@
+"""Materialized views behind the DB-backed /graph/activity/* endpoints.
+
+The dashboards chart activity from imaging_results, voice_results and
+interactions. The GROUP BY / date_trunc work runs in Postgres, and the
+results are kept in small materialized views. A startup background task
+refreshes them periodically, so a dashboard read costs the same however
+large the source tables grow. With several uvicorn workers only one of
+them (the holder of a Postgres advisory lock) creates and refreshes the
+views; the others take over if it goes away.
+
+Everything goes through the asyncpg pool (utils.db.get_pg_pool), which
+accepts the same plain postgresql:// DATABASE_URL that every other
+Postgres query in the app uses.
+"""
+
+import asyncio
+import os
+import time
+
+import asyncpg
+
+from utils.db import DATABASE_URL, get_pg_pool, ensure_imaging_schema
+
+ANALYTICS_REFRESH_SECONDS = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+
+# source name → (view, table) for the per-day activity views
+DAILY_ACTIVITY_VIEWS = {
+    "imaging": ("mv_imaging_daily", "imaging_results"),
+    "voice": ("mv_voice_daily", "voice_results"),
+    "interactions": ("mv_interactions_daily", "interactions"),
+}
+
+URGENCY_VIEW = "mv_imaging_urgency"
+
+# pg_try_advisory_lock key: whoever holds it is the one process maintaining the views
+ANALYTICS_LOCK_KEY = 7_412_026_016
+
+URGENCY_LEVELS = ("low", "moderate", "high", "emergency")
+
+
+def _view_statements():
+    """(view, [CREATE ..., CREATE UNIQUE INDEX ...]) for every analytics view."""
+    statements = []
+    for view, table in DAILY_ACTIVITY_VIEWS.values():
+        statements.append((view, [
+            f"""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS
+            SELECT date_trunc('day', created_at)::date AS day, COUNT(*) AS analyses
+            FROM {table}
+            WHERE created_at IS NOT NULL
+            GROUP BY 1
+            """,
+            # A unique index is what allows REFRESH ... CONCURRENTLY
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {view}_day ON {view} (day)",
+        ]))
+
+    statements.append((URGENCY_VIEW, [
+        f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {URGENCY_VIEW} AS
+        SELECT COALESCE(LOWER(urgency_level), 'unknown') AS urgency_level, COUNT(*) AS analyses
+        FROM imaging_results
+        GROUP BY 1
+        """,
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {URGENCY_VIEW}_level ON {URGENCY_VIEW} (urgency_level)",
+    ]))
+    return statements
+
+
+def urgency_from_recommendations(recommendations):
+    """urgency_level from the recommendation agent's output, or None."""
+    if not isinstance(recommendations, dict):
+        return None
+    inner = recommendations.get("recommendations")
+    level = (inner if isinstance(inner, dict) else recommendations).get("urgency_level")
+    if not isinstance(level, str):
+        return None
+    level = level.strip().lower()
+    return level if level in URGENCY_LEVELS else None
+
+
+async def ensure_analytics_views() -> list:
+    """Create the views that don't exist yet. Returns the available views."""
+    if not DATABASE_URL:
+        return []
+
+    # Urgency was never persisted; imaging results now store the level the
+    # recommendation agent assigned (utils.db adds the column) so it can be aggregated.
+    try:
+        await ensure_imaging_schema()
+    except Exception as e:
+        print("Analytics schema update failed:", e)
+
+    pool = await get_pg_pool()
+    async with pool.acquire() as con:
+        # One transaction per view: a missing table only disables its own chart
+        available = []
+        for view, statements in _view_statements():
+            try:
+                async with con.transaction():
+                    for statement in statements:
+                        await con.execute(statement)
+                available.append(view)
+            except Exception as e:
+                print(f"Analytics view {view} unavailable:", e)
+    return available
+
+
+async def refresh_analytics_views(views) -> None:
+    """REFRESH every view, concurrently so dashboard reads never block."""
+    pool = await get_pg_pool()
+    for view in views:
+        started = time.perf_counter()
+        try:
+            async with pool.acquire() as con:
+                await con.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+        except Exception as e:
+            print(f"Analytics view {view} refresh failed:", e)
+            continue
+        print(f"🔄 Refreshed {view} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+async def maintain_analytics_views():
+    """
+    Background task for every worker: try to become the single maintainer
+    (session advisory lock on a dedicated connection), then create the views
+    and refresh them every ANALYTICS_REFRESH_SECONDS. The lock goes with the
+    connection, so if the maintainer dies another worker takes over at its
+    next attempt.
+    """
+    while True:
+        lock_con = None
+        try:
+            lock_con = await asyncpg.connect(DATABASE_URL)
+            if await lock_con.fetchval("SELECT pg_try_advisory_lock($1)", ANALYTICS_LOCK_KEY):
+                print("📊 This worker maintains the analytics views")
+                views = await ensure_analytics_views()
+                while views:
+                    await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
+                    await lock_con.fetchval("SELECT 1")   # lost the lock connection → re-elect
+                    await refresh_analytics_views(views)
+                return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Analytics views unavailable:", e)
+        finally:
+            if lock_con is not None:
+                await lock_con.close()
+        await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
+
+
+async def daily_activity(days: int) -> dict:
+    """Analyses per day per source over the last `days` days, read from the views."""
+    pool = await get_pg_pool()
+    by_source = {}
+    all_days = set()
+    for source, (view, _) in DAILY_ACTIVITY_VIEWS.items():
+        try:
+            async with pool.acquire() as con:
+                rows = await con.fetch(
+                    f"SELECT day, analyses FROM {view} WHERE day >= CURRENT_DATE - $1::int ORDER BY day",
+                    days,
+                )
+        except Exception as e:
+            print(f"Analytics view {view} read failed:", e)
+            rows = []
+        by_source[source] = {row["day"]: int(row["analyses"]) for row in rows}
+        all_days.update(by_source[source])
+
+    labels = sorted(all_days)
+    return {
+        "labels": [d.isoformat() for d in labels],
+        "series": {
+            source: [counts.get(d, 0) for d in labels]
+            for source, counts in by_source.items()
+        },
+    }
+
+
+async def urgency_counts() -> dict:
+    """Imaging analyses per urgency level, read from the urgency view."""
+    pool = await get_pg_pool()
+    async with pool.acquire() as con:
+        rows = await con.fetch(f"SELECT urgency_level, analyses FROM {URGENCY_VIEW}")
+    counts = {row["urgency_level"]: int(row["analyses"]) for row in rows}
+    labels = list(URGENCY_LEVELS) + ["unknown"]
+    return {"labels": labels, "values": [counts.get(level, 0) for level in labels]}
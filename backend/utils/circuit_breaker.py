@@ -0,0 +1,156 @@
+"""Per-model circuit breakers for the LLM fallback chains.
+
+A model that keeps failing (or is reported as not available) is skipped for
+a backoff window instead of costing every request a failed round trip.
+After the window one request is let through as a half-open probe: success
+closes the breaker, failure re-opens it with twice the backoff.
+
+Errors are classified by OpenAI exception type (record_error): only
+service-side trouble counts against a model. A request the API rejects
+(bad audio format, context too long, ...) says nothing about the model's
+health and never opens a breaker.
+"""
+
+import os
+import threading
+import time
+
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    NotFoundError,
+    PermissionDeniedError,
+    RateLimitError,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BASE_BACKOFF = float(os.getenv("LLM_BREAKER_BACKOFF", "30"))
+MAX_BACKOFF = float(os.getenv("LLM_BREAKER_MAX_BACKOFF", "900"))
+PROBE_TIMEOUT = float(os.getenv("LLM_BREAKER_PROBE_TIMEOUT", "120"))
+
+# Count towards LLM_BREAKER_FAILURES
+TRANSIENT_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+# The model itself is unusable for this key → open at once
+UNAVAILABLE_ERRORS = (NotFoundError, PermissionDeniedError)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 base_backoff: float = BASE_BACKOFF, max_backoff: float = MAX_BACKOFF):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.state = CLOSED
+        self.failures = 0          # consecutive failures while closed
+        self.trips = 0             # consecutive opens, drives the exponential backoff
+        self.open_until = 0.0
+        self.probe_started = 0.0
+        self.last_error = None
+        self.total_failures = 0
+        self.total_successes = 0
+        self.skipped = 0
+        self.ignored_errors = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True if a call may go to this model now."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and now >= self.open_until:
+                self.state = HALF_OPEN
+                self.probe_started = now
+                return True
+
+            # Half-open: only one probe at a time (unless it never reported back)
+            if self.state == HALF_OPEN and now - self.probe_started > PROBE_TIMEOUT:
+                self.probe_started = now
+                return True
+
+            self.skipped += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+            self.total_successes += 1
+
+    def record_failure(self, error=None, fatal: bool = False):
+        """fatal=True opens the breaker at once (e.g. model does not exist)."""
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            self.last_error = str(error)[:300] if error is not None else None
+
+            if self.state == HALF_OPEN or fatal or self.failures >= self.failure_threshold:
+                backoff = min(self.base_backoff * (2 ** self.trips), self.max_backoff)
+                self.trips += 1
+                self.state = OPEN
+                self.open_until = time.monotonic() + backoff
+                self.failures = 0
+
+    def record_error(self, error):
+        """Record an exception from a call to this model, classified by type (see module docstring)."""
+        if is_model_unavailable_error(error):
+            self.record_failure(error, fatal=True)
+        elif isinstance(error, TRANSIENT_ERRORS):
+            self.record_failure(error)
+        else:
+            # Input errors (BadRequestError, ...): the model answered, so a
+            # half-open probe has done its job
+            with self._lock:
+                self.ignored_errors += 1
+                if self.state == HALF_OPEN:
+                    self.state = CLOSED
+                    self.failures = 0
+                    self.trips = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = max(0.0, self.open_until - time.monotonic()) if self.state == OPEN else 0.0
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "trips": self.trips,
+                "retry_in_seconds": round(retry_in, 1),
+                "total_failures": self.total_failures,
+                "total_successes": self.total_successes,
+                "skipped_calls": self.skipped,
+                "ignored_errors": self.ignored_errors,
+                "last_error": self.last_error,
+            }
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breaker_metrics() -> list:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
+
+
+def is_model_unavailable_error(error) -> bool:
+    """Errors meaning the model itself is unusable (not found / no access)."""
+    return isinstance(error, UNAVAILABLE_ERRORS)
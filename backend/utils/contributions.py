@@ -0,0 +1,114 @@
+"""Per-feature contribution engine for the risk model.
+
+For XGBoost models the booster computes exact TreeSHAP contributions itself
+(``pred_contribs=True``), so the heavy ``shap`` package is only imported as a
+fallback for other model types. ``ContributionEngine.shap_values`` mirrors
+``shap.TreeExplainer.shap_values`` so callers do not care which path runs.
+
+Benchmark both paths on the bundled dataset (run from backend/):
+
+    python -m utils.contributions
+"""
+
+import numpy as np
+
+
+def xgboost_booster(model):
+    """The underlying xgboost.Booster of model, or None if it is not XGBoost."""
+    try:
+        import xgboost as xgb
+    except ImportError:
+        return None
+
+    if isinstance(model, xgb.Booster):
+        return model
+    if isinstance(model, xgb.XGBModel):
+        return model.get_booster()
+    # utils.model_artifacts.NativeBoosterModel and similar thin wrappers
+    booster = getattr(model, "booster", None)
+    if isinstance(booster, xgb.Booster):
+        return booster
+    return None
+
+
+class ContributionEngine:
+    def __init__(self, model):
+        self.model = model
+        self.booster = xgboost_booster(model)
+        self._shap_explainer = None
+
+        if self.booster is None:
+            import shap
+            self._shap_explainer = shap.TreeExplainer(model)
+
+    @property
+    def backend(self) -> str:
+        return "xgboost" if self.booster is not None else "shap"
+
+    def shap_values(self, X):
+        """Contribution of every feature for every row of X (log-odds space)."""
+        if self.booster is None:
+            return self._shap_explainer.shap_values(X)
+
+        import xgboost as xgb
+
+        dmatrix = xgb.DMatrix(np.asarray(X, dtype=float), feature_names=self.booster.feature_names)
+        contribs = self.booster.predict(dmatrix, pred_contribs=True)
+        # Last column is the bias term (the explainer's expected value)
+        return contribs[..., :-1]
+
+
+if __name__ == "__main__":
+    import os
+    import resource
+    import sys
+    import time
+
+    import joblib
+
+    from utils.feature_encoding import dataset_feature_matrix
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    model = joblib.load(os.path.join(base_dir, "xgboost_health_model.pkl"))
+    X, _, _ = dataset_feature_matrix(base_dir)
+
+    def rss_mb():
+        # ru_maxrss is KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def bench(label, fn, repeats=200):
+        fn(X[:1])
+        single = []
+        for i in range(repeats):
+            row = X[i % len(X):i % len(X) + 1]
+            t = time.perf_counter()
+            fn(row)
+            single.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        fn(X)
+        full = time.perf_counter() - t
+        print(
+            f"{label:8s} 1-row p50 {np.percentile(single, 50) * 1e3:7.3f} ms  "
+            f"p99 {np.percentile(single, 99) * 1e3:7.3f} ms  "
+            f"{len(X)}-row {full * 1e3:8.2f} ms"
+        )
+
+    modules_before, rss_before = len(sys.modules), rss_mb()
+    engine = ContributionEngine(model)
+    print(f"native  engine init: +{len(sys.modules) - modules_before} modules, peak RSS {rss_mb():.0f} MB")
+    bench("native", engine.shap_values)
+
+    try:
+        modules_before = len(sys.modules)
+        t = time.perf_counter()
+        import shap
+        explainer = shap.TreeExplainer(model)
+        print(
+            f"shap    import + explainer: {time.perf_counter() - t:.2f}s, "
+            f"+{len(sys.modules) - modules_before} modules, peak RSS {rss_mb():.0f} MB"
+        )
+        bench("shap", explainer.shap_values)
+        diff = np.abs(np.asarray(explainer.shap_values(X)) - engine.shap_values(X)).max()
+        print(f"max |native - shap| = {diff:.2e}")
+    except ImportError:
+        print("shap not installed; skipped the shap comparison")
@@ -0,0 +1,178 @@
+"""Shared, typed loader for the HealthVisionPro patient dataset.
+
+Every router reads the dataset through this module, so the CSV is parsed
+once per process (and again only when the file changes on disk) instead of
+once per router or per request.
+
+Columns get compact dtypes: categoricals for low-cardinality strings and
+int8 for the 0/1 flags. When pyarrow is installed the parsed frame is also
+written next to the CSV as an uncompressed Arrow IPC file, and later loads
+read that file instead of re-parsing the CSV (DATASET_ARROW_CACHE=0 turns
+this off). The cache records the source CSV's exact mtime and size in its
+schema metadata and is only used when both still match. The cache saves CSV parse + dtype conversion time only: the
+frame is still converted to regular pandas columns, so resident memory is
+the same as after a CSV load. The dtypes above are what keep it small.
+"""
+
+import os
+import threading
+import time
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.getenv("DATASET_CSV_PATH", os.path.join(BASE_DIR, "healthvisionpro_dataset_1000.csv"))
+ARROW_PATH = os.path.splitext(CSV_PATH)[0] + ".arrow"
+ARROW_CACHE_ENABLED = os.getenv("DATASET_ARROW_CACHE", "1") != "0"
+# Arrow schema metadata key holding the source CSV's fingerprint
+ARROW_SOURCE_KEY = b"healthvisionpro.source_csv"
+
+DATASET_DTYPES = {
+    "gender": "category",
+    "smoking_status": "category",
+    "age": "int16",
+    "patients_visited": "int16",
+    "diabetes": "int8",
+    "hypertension": "int8",
+    "heart_disease": "int8",
+    "target_urgent_followup": "int8",
+}
+
+_lock = threading.Lock()
+_df = None
+_mtime = None
+_listeners = []
+
+
+def _apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for col, dtype in DATASET_DTYPES.items():
+        if col not in df.columns:
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError) as e:
+            # e.g. NaNs in an int column — keep pandas' inferred dtype
+            print(f"Dataset: keeping inferred dtype for {col}: {e}")
+    return df
+
+
+def _csv_fingerprint():
+    """Identifies the CSV the Arrow cache was built from: exact mtime (ns) + size.
+    An exact match, not "cache newer than CSV": cp -p / rsync / git checkout
+    can swap in a different CSV with an older mtime."""
+    stat = os.stat(CSV_PATH)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _read_arrow_cache():
+    if not ARROW_CACHE_ENABLED or not os.path.exists(ARROW_PATH):
+        return None
+    try:
+        import pyarrow.feather as feather
+        # memory_map only avoids buffering the file on the heap first;
+        # to_pandas() still copies into pandas-owned (numpy/categorical) columns
+        table = feather.read_table(ARROW_PATH, memory_map=True)
+        source = (table.schema.metadata or {}).get(ARROW_SOURCE_KEY, b"").decode()
+        if source != _csv_fingerprint():
+            return None
+        return table.to_pandas()
+    except Exception as e:
+        print("Dataset: Arrow cache unreadable, falling back to CSV:", e)
+        return None
+
+
+def _write_arrow_cache(df, fingerprint):
+    if not ARROW_CACHE_ENABLED:
+        return
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError:
+        return
+    try:
+        table = pa.Table.from_pandas(df)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            ARROW_SOURCE_KEY: fingerprint,
+        })
+        tmp_path = ARROW_PATH + ".tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, ARROW_PATH)
+    except Exception as e:
+        print("Dataset: could not write Arrow cache:", e)
+
+
+def _load():
+    started = time.perf_counter()
+    mtime = os.path.getmtime(CSV_PATH)
+    fingerprint = _csv_fingerprint()
+
+    df = _read_arrow_cache()
+    source = "Arrow cache"
+    if df is None:
+        df = _apply_dtypes(pd.read_csv(CSV_PATH))
+        _write_arrow_cache(df, fingerprint)
+        source = "CSV"
+
+    mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+    print(
+        f"✅ Dataset loaded from {source} ({CSV_PATH}): {len(df)} rows, "
+        f"{mb:.1f} MB in memory, {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    return df, mtime
+
+
+def get_dataset() -> pd.DataFrame:
+    """The shared dataset frame (empty if the CSV is missing). Treat as read-only."""
+    global _df, _mtime
+    if _df is None:
+        with _lock:
+            if _df is None:
+                try:
+                    _df, _mtime = _load()
+                except Exception as e:
+                    print("❌ CSV load failed:", e)
+                    _df, _mtime = pd.DataFrame(), None
+    return _df
+
+
+def dataset_mtime():
+    """mtime of the CSV the current frame was loaded from (None if not loaded)."""
+    get_dataset()
+    return _mtime
+
+
+def csv_mtime():
+    """Current mtime of the CSV on disk (None if missing)."""
+    try:
+        return os.path.getmtime(CSV_PATH)
+    except OSError:
+        return None
+
+
+def on_dataset_load(callback):
+    """Call callback(df) now and after every reload (used to rebuild indexes)."""
+    _listeners.append(callback)
+    callback(get_dataset())
+
+
+def reload_dataset_if_changed() -> bool:
+    """Re-read the CSV if it changed on disk and notify listeners. Returns True on reload."""
+    global _df, _mtime
+    current = csv_mtime()
+    if current is None or current == dataset_mtime():
+        return False
+
+    with _lock:
+        if current == _mtime:
+            return False
+        try:
+            df, mtime = _load()
+        except Exception as e:
+            print("Warning: failed to reload CSV dataset:", e)
+            return False
+        _df, _mtime = df, mtime
+
+    for callback in _listeners:
+        callback(df)
+    return True
@@ -0,0 +1,85 @@
+"""Precomputed distributions over the shared dataset for the /graph/* routes.
+
+Every distribution the dashboard charts is computed in one pass over the
+typed frame from utils.dataset and kept in memory. The cache is tied to
+the frame object, so it is rebuilt only when the CSV changes on disk and
+utils.dataset reloads it.
+"""
+
+import threading
+import time
+
+from utils.dataset import get_dataset, reload_dataset_if_changed
+
+# column → labels for the 0/1 values of the binary condition flags
+BINARY_DISTRIBUTIONS = {
+    "heart_disease": ["No Heart Disease", "Heart Disease"],
+    "diabetes": ["No Diabetes", "Diabetic"],
+    "hypertension": ["No Hypertension", "Hypertensive"],
+}
+
+# smoking_status value → chart label (in chart order)
+SMOKING_LABELS = {
+    "never": "Non-Smoker",
+    "former": "Former Smoker",
+    "current": "Smoker",
+}
+
+_lock = threading.Lock()
+_cached_for = None     # the dataset frame the aggregates were computed from
+_aggregates = None
+
+
+def _empty_chart(labels=()):
+    return {"labels": list(labels), "values": [0] * len(labels)}
+
+
+def _compute(df):
+    started = time.perf_counter()
+    result = {"rows": int(len(df))}
+
+    visit_col = next((c for c in ("patients_visited", "visit_count") if c in df.columns), None)
+    if visit_col:
+        counts = df[visit_col].dropna().astype(int).value_counts().sort_index()
+        result["visit_distribution"] = {
+            "labels": [int(v) for v in counts.index],
+            "values": [int(n) for n in counts.values],
+        }
+    else:
+        result["visit_distribution"] = _empty_chart()
+
+    for col, labels in BINARY_DISTRIBUTIONS.items():
+        if col not in df.columns:
+            result[col] = _empty_chart(labels)
+            continue
+        counts = df[col].value_counts()
+        result[col] = {"labels": labels, "values": [int(counts.get(0, 0)), int(counts.get(1, 0))]}
+
+    if "smoking_status" in df.columns:
+        counts = df["smoking_status"].astype(str).str.strip().str.lower().value_counts()
+        result["smoking_status"] = {
+            "labels": list(SMOKING_LABELS.values()),
+            "values": [int(counts.get(value, 0)) for value in SMOKING_LABELS],
+        }
+    else:
+        result["smoking_status"] = _empty_chart(SMOKING_LABELS.values())
+
+    print(f"✅ Graph aggregates computed over {len(df)} rows in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return result
+
+
+def get_aggregates() -> dict:
+    """All dashboard distributions, recomputed only when the dataset changes."""
+    global _cached_for, _aggregates
+
+    # A stat() per call; the actual reload only happens when the mtime moved
+    reload_dataset_if_changed()
+    df = get_dataset()
+    if df is _cached_for and _aggregates is not None:
+        return _aggregates
+
+    with _lock:
+        if df is not _cached_for or _aggregates is None:
+            _aggregates = _compute(df)
+            _cached_for = df
+    return _aggregates
@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 load_dotenv()
 import asyncpg        
+import asyncio
 import json
 from sqlalchemy import text
 import os
@@ -28,11 +29,15 @@ else:
 # POSTGRES ASYNC POOL
 # ==========================
 pg_pool = None
+_pg_pool_lock = asyncio.Lock()
 
 async def get_pg_pool():
     global pg_pool
     if pg_pool is None:
-        pg_pool = await asyncpg.create_pool(DATABASE_URL, max_size=10)
+        # Single-flight: a burst of first requests must not each open a pool
+        async with _pg_pool_lock:
+            if pg_pool is None:
+                pg_pool = await asyncpg.create_pool(DATABASE_URL, max_size=10)
     return pg_pool
 
 
@@ -67,23 +72,87 @@ async def save_appointment(patient_id: int, summary: str, start: str, end: str,
 
 
 # ===============================================================
-# SAVE MEDICAL IMAGING RESULT (History Tab)
+# IMAGING RESULTS SCHEMA ADDITIONS
 # ===============================================================
-async def save_imaging_result(file_name: str, report: str, annotated_img: str, findings: list):
+# Optional imaging_results columns → statements that add them:
+# urgency_level feeds the activity analytics, content_key the imaging report cache.
+IMAGING_OPTIONAL_COLUMNS = {
+    "urgency_level": [
+        "ALTER TABLE imaging_results ADD COLUMN IF NOT EXISTS urgency_level TEXT",
+    ],
+    "content_key": [
+        "ALTER TABLE imaging_results ADD COLUMN IF NOT EXISTS content_key TEXT",
+        "CREATE INDEX IF NOT EXISTS imaging_results_content_key ON imaging_results (content_key, created_at DESC)",
+    ],
+    "recommendations": [
+        "ALTER TABLE imaging_results ADD COLUMN IF NOT EXISTS recommendations JSONB",
+    ],
+}
+
+imaging_columns = None
+_imaging_schema_lock = asyncio.Lock()
+
+async def ensure_imaging_schema() -> set:
+    """
+    Add the optional imaging_results columns once per process and return
+    the ones that actually exist. main.py awaits this before serving; if an
+    ALTER is refused (e.g. no privilege) inserts simply skip that column.
+    """
+    global imaging_columns
+    if imaging_columns is None:
+        async with _imaging_schema_lock:
+            if imaging_columns is None:
+                pool = await get_pg_pool()
+                async with pool.acquire() as con:
+                    for column, statements in IMAGING_OPTIONAL_COLUMNS.items():
+                        try:
+                            for statement in statements:
+                                await con.execute(statement)
+                        except Exception as e:
+                            print(f"imaging_results.{column} could not be added:", e)
+                    rows = await con.fetch(
+                        """
+                        SELECT column_name FROM information_schema.columns
+                        WHERE table_name = 'imaging_results' AND column_name = ANY($1::text[])
+                        """,
+                        list(IMAGING_OPTIONAL_COLUMNS),
+                    )
+                imaging_columns = {row["column_name"] for row in rows}
+    return imaging_columns
+
 
+# ===============================================================
+# SAVE MEDICAL IMAGING RESULT (History Tab)
+# ===============================================================
+async def save_imaging_result(file_name: str, report: str, annotated_img: str, findings: list,
+                              urgency_level: str = None, content_key: str = None,
+                              recommendations: dict = None):
+
+    values = {
+        "file_name": file_name,
+        "report": report,
+        "annotated_img": annotated_img,
+        "findings": json.dumps(findings),
+    }
+    optional = {
+        "urgency_level": urgency_level,
+        "content_key": content_key,
+        "recommendations": json.dumps(recommendations) if recommendations else None,
+    }
+    columns = await ensure_imaging_schema()
+    values.update({col: value for col, value in optional.items() if col in columns})
+
+    placeholders = ", ".join(f"${i}" for i in range(1, len(values) + 1))
     pool = await get_pg_pool()
     async with pool.acquire() as con:
         row = await con.fetchrow(
-            """
+            f"""
             INSERT INTO imaging_results 
-            (file_name, report, annotated_img, findings, created_at)
-            VALUES ($1, $2, $3, $4, NOW())
+            ({", ".join(values)}, created_at)
+            VALUES ({placeholders}, NOW())
             RETURNING id;
             """,
-            file_name,
-            report,
-            annotated_img,
-            json.dumps(findings)
+            *values.values()
         )
 
     return row["id"]
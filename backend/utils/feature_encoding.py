@@ -0,0 +1,124 @@
+"""Patient records → model feature matrix.
+
+One implementation shared by the serving path (routes.predict preprocess /
+preprocess_batch) and the offline benchmarks (utils.contributions,
+utils.model_artifacts), so a benchmark scores exactly what production does.
+
+The fitted LabelEncoders are compiled once into an encoding plan of plain
+dict lookups; a LabelEncoder code is simply the category's position in
+classes_.
+"""
+
+import os
+
+import numpy as np
+
+
+def build_encoding_plan(encoders, feature_order):
+    """
+    Compile the fitted LabelEncoders + feature order into plain lookups.
+
+    Returns a list of (column, lookup) in model column order, where lookup is
+    a {category: code} dict for categorical columns and None for numeric ones.
+    """
+    plan = []
+    for col in feature_order:
+        if col in encoders:
+            classes = encoders[col].classes_.tolist()
+            plan.append((col, {value: code for code, value in enumerate(classes)}))
+        else:
+            plan.append((col, None))
+    return plan
+
+
+def age_group_for(age):
+    """The age_group category the model was trained with. Raises ValueError/TypeError on a bad age."""
+    age = int(age)
+    if age < 40:
+        return "20-40"
+    if age <= 60:
+        return "40-60"
+    return "60+"
+
+
+def _reject_unseen(col, value):
+    raise ValueError(f"Unseen value for {col}: {value!r}")
+
+
+def encode_records(records: list, encoding_plan, unseen_code=_reject_unseen):
+    """
+    Build ONE feature matrix for many records.
+
+    unseen_code(col, value) returns the code for a category the encoders never
+    saw, or raises ValueError to reject the record. Returns (X, errors) where
+    errors maps the index of every record that could not be encoded to a
+    reason; those rows are left out of X, which keeps input order.
+    """
+    errors = {}
+
+    for i, record in enumerate(records):
+        missing = [col for col, _ in encoding_plan if col not in record]
+        if missing:
+            errors[i] = f"Missing features: {', '.join(missing)}"
+
+    valid_idx = [i for i in range(len(records)) if i not in errors]
+    X = np.empty((len(valid_idx), len(encoding_plan)), dtype=float)
+
+    for j, (col, lookup) in enumerate(encoding_plan):
+        values = [records[i][col] for i in valid_idx]
+        if lookup is None:
+            # Whole column at once; None would silently become NaN here, so
+            # any None / bad value takes the per-row path (same rules as preprocess)
+            if not any(v is None for v in values):
+                try:
+                    X[:, j] = np.asarray(values, dtype=float)
+                    continue
+                except (TypeError, ValueError):
+                    pass
+            for row, value in enumerate(values):
+                try:
+                    X[row, j] = float(value)
+                except (TypeError, ValueError):
+                    errors.setdefault(valid_idx[row], f"Invalid numeric value for {col}: {value!r}")
+                    X[row, j] = np.nan
+            continue
+
+        for row, value in enumerate(values):
+            try:
+                code = lookup.get(value)
+                X[row, j] = unseen_code(col, value) if code is None else code
+            except (TypeError, ValueError) as e:
+                # TypeError: unhashable value (list / dict) in a categorical column
+                reason = str(e) if isinstance(e, ValueError) else f"Invalid value for {col}: {value!r}"
+                errors.setdefault(valid_idx[row], reason)
+                X[row, j] = np.nan
+
+    if len(errors) > len(records) - len(valid_idx):
+        keep = [row for row, i in enumerate(valid_idx) if i not in errors]
+        X = X[keep]
+
+    return X, errors
+
+
+def dataset_feature_matrix(base_dir: str):
+    """
+    The bundled dataset encoded exactly like the serving path (for the
+    benchmarks in utils.contributions / utils.model_artifacts).
+    Returns (X, encoders, feature_order).
+    """
+    import joblib
+
+    from utils.dataset import get_dataset
+
+    encoders = joblib.load(os.path.join(base_dir, "encoders.pkl"))
+    feature_order = joblib.load(os.path.join(base_dir, "feature_order.pkl"))
+
+    records = get_dataset().to_dict("records")
+    for record in records:
+        if "age_group" not in record and "age" in record:
+            record["age_group"] = age_group_for(record["age"])
+
+    X, errors = encode_records(records, build_encoding_plan(encoders, feature_order))
+    if errors:
+        print(f"Skipped {len(errors)} rows that could not be encoded, e.g. {next(iter(errors.values()))}")
+    return X, encoders, feature_order
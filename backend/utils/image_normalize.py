@@ -0,0 +1,254 @@
+"""Normalize uploads before they are sent to the vision model.
+
+Phone photos arrive as multi-megabyte JPEGs and scans as 16-bit PNG/TIFF.
+Sending them as-is inflates the request, the upload time and the
+vision-token cost. This module does the following:
+
+  - sniffs the real format from the magic bytes, so the data URL is
+    labelled correctly, and rejects what the vision API cannot read
+    (unknown bytes, DICOM, files Pillow cannot decode) with
+    UnsupportedImageError;
+  - downscales so the longest edge is at most IMAGE_MAX_EDGE pixels;
+  - reduces 16-bit / float images to 8-bit and applies EXIF orientation;
+  - re-encodes as IMAGE_NORMALIZE_FORMAT (jpeg by default) without any
+    metadata. EXIF, GPS and device tags are dropped. When re-encoding would
+    not shrink a JPEG/PNG, the original is sent with its metadata segments
+    cut out instead (pixels untouched).
+
+Pillow is optional. Without it, vision-ready formats pass through unchanged
+and only the MIME label is fixed (BMP/TIFF cannot be converted and are
+rejected). Decoding is CPU-bound, so async callers use
+normalize_image_async, which runs on a worker thread.
+"""
+
+import asyncio
+import io
+import os
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:   # optional dependency
+    Image = None
+    ImageOps = None
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+IMAGE_NORMALIZE_FORMAT = os.getenv("IMAGE_NORMALIZE_FORMAT", "jpeg").strip().lower()
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_NORMALIZE_ENABLED = os.getenv("IMAGE_NORMALIZE", "1") != "0"
+# Only used to estimate the upload time saved in the log line
+IMAGE_UPLINK_MBPS = float(os.getenv("IMAGE_UPLINK_MBPS", "10"))
+
+# Formats the vision API accepts as-is
+VISION_FORMATS = {"png", "jpeg", "webp", "gif"}
+OUTPUT_FORMATS = {"jpeg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+# JPEG APPn (EXIF, XMP, ICC, IPTC, ...) and COM segments; APP0 (JFIF) and
+# APP14 (Adobe colour transform) are kept because decoders need them
+JPEG_METADATA_MARKERS = {0xFE} | {m for m in range(0xE1, 0xF0) if m != 0xEE}
+PNG_METADATA_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"eXIf", b"tIME"}
+
+
+class UnsupportedImageError(ValueError):
+    """The upload is not an image the vision model can be sent."""
+
+
+class NormalizedImage:
+    def __init__(self, data: bytes, fmt: str, info: dict):
+        self.data = data
+        self.format = fmt
+        self.info = info
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+
+def sniff_image_format(data: bytes):
+    """Real image format from the leading bytes ("png", "jpeg", ...), or None."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:2] == b"BM":
+        return "bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if data[128:132] == b"DICM":
+        return "dicom"
+    return None
+
+
+def unsupported_image_reason(data: bytes):
+    """Why these bytes can't go to the vision model (None if they can). Endpoints answer 415."""
+    fmt = sniff_image_format(data)
+    if fmt is None:
+        return "Unrecognised image format; upload PNG, JPEG, WebP, GIF, BMP or TIFF"
+    if fmt == "dicom":
+        return "DICOM files are not supported; export the study as PNG or JPEG"
+    if fmt not in VISION_FORMATS and not (IMAGE_NORMALIZE_ENABLED and Image):
+        return f"{fmt.upper()} images cannot be converted on this server; upload PNG or JPEG"
+    return None
+
+
+def strip_metadata(data: bytes, fmt: str):
+    """JPEG/PNG bytes with metadata segments removed (pixel data untouched), or None."""
+    try:
+        if fmt == "jpeg":
+            return _strip_jpeg(data)
+        if fmt == "png":
+            return _strip_png(data)
+    except (IndexError, ValueError):
+        pass
+    return None
+
+
+def _strip_jpeg(data: bytes) -> bytes:
+    out, i = [data[:2]], 2
+    while i < len(data):
+        if data[i] != 0xFF:
+            raise ValueError("not at a JPEG marker")
+        marker = data[i + 1]
+        if marker == 0xFF:            # fill byte
+            i += 1
+            continue
+        if marker == 0xDA:            # start of scan: the rest is image data
+            out.append(data[i:])
+            break
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker not in JPEG_METADATA_MARKERS:
+            out.append(data[i:i + 2 + length])
+        i += 2 + length
+    return b"".join(out)
+
+
+def _strip_png(data: bytes) -> bytes:
+    out, i = [data[:8]], 8
+    while i < len(data):
+        length = int.from_bytes(data[i:i + 4], "big")
+        chunk_type = data[i + 4:i + 8]
+        end = i + 12 + length         # length + type + data + CRC
+        if end > len(data):
+            raise ValueError("truncated PNG chunk")
+        if chunk_type not in PNG_METADATA_CHUNKS:
+            out.append(data[i:end])
+        i = end
+    return b"".join(out)
+
+
+def normalization_signature() -> str:
+    """Part of the report cache key: different settings send the model a different image."""
+    if not (IMAGE_NORMALIZE_ENABLED and Image):
+        return "raw"
+    return f"{IMAGE_NORMALIZE_FORMAT}:{IMAGE_MAX_EDGE}:{IMAGE_JPEG_QUALITY}"
+
+
+def _to_8bit(img):
+    """16-bit / 32-bit / float scans → 8-bit grayscale, stretched to the full range."""
+    if img.mode not in ("I", "I;16", "I;16B", "I;16L", "F"):
+        return img
+    import numpy as np
+
+    arr = np.asarray(img, dtype=np.float64)
+    lo, hi = float(arr.min()), float(arr.max())
+    scaled = (arr - lo) * (255.0 / (hi - lo)) if hi > lo else np.zeros_like(arr)
+    return Image.fromarray(scaled.astype(np.uint8), mode="L")
+
+
+def _for_output(img, fmt):
+    if fmt == "jpeg":
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (0, 0, 0))
+            background.paste(img, mask=img.getchannel("A"))
+            return background
+        if img.mode not in ("RGB", "L"):
+            return img.convert("RGB")
+        return img
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        return img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    return img
+
+
+def normalize_image(data: bytes) -> NormalizedImage:
+    """Blocking normalization; see the module docstring. Raises UnsupportedImageError."""
+    started = time.perf_counter()
+    reason = unsupported_image_reason(data)
+    if reason:
+        raise UnsupportedImageError(reason)
+
+    fmt = sniff_image_format(data)
+    info = {"original_format": fmt, "original_bytes": len(data)}
+
+    if not IMAGE_NORMALIZE_ENABLED or Image is None:
+        info["normalized"] = False
+        return NormalizedImage(data, fmt, info)
+
+    # Valid magic but undecodable (truncated, corrupt): the vision API would
+    # reject it too, so it is the upload's fault → 415 at the endpoints
+    try:
+        with Image.open(io.BytesIO(data)) as opened:
+            opened.load()
+            rotated = opened.getexif().get(0x0112, 1) not in (0, 1)
+            img = ImageOps.exif_transpose(opened)
+            if getattr(opened, "n_frames", 1) > 1:
+                info["frames_dropped"] = opened.n_frames - 1   # first frame only
+    except Exception as e:
+        raise UnsupportedImageError(f"Could not decode {fmt.upper()} image; the file is corrupt or truncated") from e
+    info["original_size"] = list(img.size)
+
+    try:
+        img = _to_8bit(img)
+        if max(img.size) > IMAGE_MAX_EDGE:
+            img.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+        resized = list(img.size) != info["original_size"]
+
+        out_fmt = IMAGE_NORMALIZE_FORMAT if IMAGE_NORMALIZE_FORMAT in OUTPUT_FORMATS else "jpeg"
+        buffer = io.BytesIO()
+        save_kwargs = {"quality": IMAGE_JPEG_QUALITY, "optimize": True} if out_fmt in ("jpeg", "webp") else {"optimize": True}
+        # No exif= / icc_profile= / pnginfo= passed → metadata is stripped
+        _for_output(img, out_fmt).save(buffer, OUTPUT_FORMATS[out_fmt], **save_kwargs)
+        encoded = buffer.getvalue()
+    except Exception as e:
+        if fmt not in VISION_FORMATS:
+            raise UnsupportedImageError(f"Could not convert {fmt.upper()} image: {e}")
+        print("Image re-encoding failed, sending the original:", e)
+        info["normalized"] = False
+        info["error"] = str(e)
+        return NormalizedImage(strip_metadata(data, fmt) or data, fmt, info)
+
+    # Re-encoding a small, already-compact upload can make it bigger: send the
+    # original minus its metadata instead. Not for EXIF-rotated images — the
+    # stripped file would lose its orientation, the re-encode has it baked in.
+    if not resized and not rotated and len(encoded) >= len(data):
+        stripped = strip_metadata(data, fmt)
+        if stripped is not None:
+            info["normalized"] = False
+            info["metadata_stripped"] = len(data) - len(stripped)
+            return NormalizedImage(stripped, fmt, info)
+
+    elapsed = time.perf_counter() - started
+    saved = len(data) - len(encoded)
+    upload_saved = saved * 8 / (IMAGE_UPLINK_MBPS * 1_000_000)
+    info.update({
+        "normalized": True,
+        "format": out_fmt,
+        "size": list(img.size),
+        "bytes": len(encoded),
+        "normalize_ms": round(elapsed * 1000, 1),
+    })
+    print(
+        f"🖼️ Image normalized: {fmt} {info['original_size'][0]}x{info['original_size'][1]} "
+        f"{len(data) / 1024:.0f} KB → {out_fmt} {img.size[0]}x{img.size[1]} {len(encoded) / 1024:.0f} KB "
+        f"in {elapsed * 1000:.0f} ms (~{upload_saved * 1000:.0f} ms upload saved at {IMAGE_UPLINK_MBPS:g} Mbps)"
+    )
+    return NormalizedImage(encoded, out_fmt, info)
+
+
+async def normalize_image_async(data: bytes) -> NormalizedImage:
+    """normalize_image on a worker thread (keeps the event loop free)."""
+    return await asyncio.to_thread(normalize_image, data)
@@ -0,0 +1,109 @@
+"""Content-addressed cache for radiology reports.
+
+A vision report is fully determined by the image bytes, the radiology model
+and the system prompt, so it is cached under a hash of those three. The same
+study re-uploaded from another tab, after a retry, or by a colleague is then
+answered without another vision-model call.
+
+Tiers:
+  memory    in-process LRU/TTL (utils.cache.TTLCache). It also keeps the
+            recommendations generated for the report.
+  postgres  imaging_results.content_key: the newest successful report saved
+            for the same key, with its recommendations when they were
+            parsed. Survives restarts and is shared by every worker. Only
+            single-image analyses (/analyze/image, image jobs) save rows;
+            /analyze/images results stay in the memory tier.
+"""
+
+import hashlib
+import json
+import os
+
+from utils.cache import TTLCache
+from utils.db import DATABASE_URL, get_pg_pool, ensure_imaging_schema
+
+IMAGING_CACHE_SIZE = int(os.getenv("IMAGING_CACHE_SIZE", "256"))
+IMAGING_CACHE_TTL = float(os.getenv("IMAGING_CACHE_TTL", str(7 * 86400)))
+
+# Placeholder reports written when the agent failed must never be served from cache
+ERROR_REPORT_PREFIX = "[Error"
+
+LATEST_REPORT_SQL = """
+    SELECT {columns}
+    FROM imaging_results
+    WHERE content_key = $1 AND report IS NOT NULL AND report NOT LIKE '[Error%'
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+
+def imaging_cache_key(img_bytes: bytes, model: str, prompt_version: str) -> str:
+    image_hash = hashlib.sha256(img_bytes).hexdigest()
+    return hashlib.sha256(f"{image_hash}:{model}:{prompt_version}".encode("utf-8")).hexdigest()
+
+
+def is_cacheable_report(report) -> bool:
+    return isinstance(report, str) and bool(report.strip()) and not report.startswith(ERROR_REPORT_PREFIX)
+
+
+class ImagingReportCache:
+    def __init__(self, maxsize: int = IMAGING_CACHE_SIZE, ttl: float = IMAGING_CACHE_TTL):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def persistent_columns(self):
+        """imaging_results columns to read back, or None without a content_key column (added by utils.db)."""
+        if not DATABASE_URL:
+            return None
+        existing = await ensure_imaging_schema()
+        if "content_key" not in existing:
+            return None
+        return ["report"] + (["recommendations"] if "recommendations" in existing else [])
+
+    async def get(self, key: str):
+        """Cached entry {"report", "recommendations"?} or None; tells which tier answered."""
+        hit, entry = self.memory.lookup(key)
+        if hit:
+            return entry, "memory"
+
+        try:
+            columns = await self.persistent_columns()
+            if columns:
+                pool = await get_pg_pool()
+                async with pool.acquire() as con:
+                    row = await con.fetchrow(LATEST_REPORT_SQL.format(columns=", ".join(columns)), key)
+                if row:
+                    self.persistent_hits += 1
+                    entry = {"report": row["report"]}
+                    if row.get("recommendations"):
+                        entry["recommendations"] = json.loads(row["recommendations"])
+                    self.memory.set(key, entry)
+                    return entry, "postgres"
+        except Exception as e:
+            print("Imaging cache DB lookup failed:", e)
+
+        self.misses += 1
+        return None, None
+
+    def set(self, key: str, report: str, recommendations=None):
+        """Remember a successful report (the Postgres tier is written by save_imaging_result)."""
+        if not is_cacheable_report(report):
+            return
+        entry = {"report": report}
+        if recommendations:
+            entry["recommendations"] = recommendations
+        self.memory.set(key, entry)
+
+    def stats(self):
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.persistent_hits
+        lookups = hits + self.misses
+        return {
+            "size": memory["size"],
+            "maxsize": memory["maxsize"],
+            "memory_hits": memory["hits"],
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
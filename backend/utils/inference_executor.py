@@ -0,0 +1,248 @@
+"""Off-event-loop inference for the risk model, with micro-batching.
+
+predict / predict_proba / contributions are CPU-bound. Run inline in an
+``async def`` handler, they stall every other request on the uvicorn loop.
+InferenceExecutor runs them on a pool instead:
+
+    INFERENCE_EXECUTOR=thread   (default) a ThreadPoolExecutor. XGBoost
+                                releases the GIL while predicting, so the
+                                workers share the in-memory ModelBundle.
+    INFERENCE_EXECUTOR=process  a spawn-context ProcessPoolExecutor. Each
+                                worker loads the model once at init, and
+                                again only when a new version is requested.
+    INFERENCE_WORKERS           pool size (default: min(4, CPU count))
+
+MicroBatcher coalesces concurrent single-patient requests. Rows arriving
+within INFERENCE_BATCH_WINDOW_MS of each other (default 2 ms, at most
+INFERENCE_MAX_BATCH rows) are stacked into one matrix and scored with one
+call, and each caller gets its own row back.
+
+Benchmark (run from backend/):
+
+    python -m utils.inference_executor
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from utils.model_artifacts import load_model_file, predict_class_and_proba
+
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread").strip().lower()
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "2"))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+
+
+def score_matrix(model, explainer, X, explain=True):
+    """(classes, positive probabilities, contributions or None) for every row of X."""
+    classes, probas = predict_class_and_proba(model, X)
+    contribs = None
+    if explain:
+        try:
+            contribs = np.asarray(explainer.shap_values(X))
+        except Exception:
+            # Same fallback as routes.predict.explain_matrix
+            contribs = np.zeros_like(X, dtype=float)
+    return np.asarray(classes), np.asarray(probas), contribs
+
+
+# ---------------------------------------------------------
+# Process workers: model loaded once per process (per version)
+# ---------------------------------------------------------
+_worker_models = {}   # model signature -> (model, explainer)
+
+
+def _worker_load(model_path, signature):
+    if signature not in _worker_models:
+        from utils.contributions import ContributionEngine
+
+        model = load_model_file(model_path)
+        try:
+            explainer = ContributionEngine(model)
+        except Exception:
+            explainer = None
+        _worker_models.clear()   # keep only the version currently being served
+        _worker_models[signature] = (model, explainer)
+    return _worker_models[signature]
+
+
+def _worker_init(model_path, signature):
+    if model_path:
+        _worker_load(model_path, signature)
+
+
+def _worker_score(model_path, signature, X, explain):
+    model, explainer = _worker_load(model_path, signature)
+    return score_matrix(model, explainer, X, explain)
+
+
+class InferenceExecutor:
+    def __init__(self, kind=INFERENCE_EXECUTOR, workers=INFERENCE_WORKERS):
+        self.kind = "process" if kind == "process" else "thread"
+        self.workers = max(1, workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def start(self, bundle=None):
+        """Create the pool; process workers preload bundle's model. Idempotent."""
+        with self._pool_lock:
+            if self._pool is not None:
+                return
+            if self.kind == "process":
+                init_args = (bundle.source.model_path, bundle.signature) if bundle else (None, None)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_worker_init,
+                    initargs=init_args,
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+            print(f"✅ Inference executor: {self.workers} {self.kind} worker(s)")
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    async def score(self, bundle, X, explain=True):
+        """Score matrix X with bundle on the pool: (classes, probas, contribs or None)."""
+        self.start(bundle)
+        loop = asyncio.get_running_loop()
+        if self.kind == "process":
+            return await loop.run_in_executor(
+                self._pool, _worker_score, bundle.source.model_path, bundle.signature, X, explain
+            )
+        return await loop.run_in_executor(
+            self._pool, score_matrix, bundle.model, bundle.explainer, X, explain
+        )
+
+
+class MicroBatcher:
+    """Coalesce concurrent one-row score requests into one matrix call per window."""
+
+    def __init__(self, executor, window_ms=INFERENCE_BATCH_WINDOW_MS, max_batch=INFERENCE_MAX_BATCH):
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending = {}   # bundle signature -> (bundle, [(row, explain, future), ...])
+        self.batches = 0
+        self.rows = 0
+
+    async def score_row(self, bundle, row, explain=True):
+        """(class, probability, contributions or None) for a single 1×n row."""
+        if self.window <= 0:
+            classes, probas, contribs = await self.executor.score(bundle, row, explain)
+            return classes[0], probas[0], None if contribs is None else contribs[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        key = bundle.signature
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = (bundle, [])
+            self._pending[key] = entry
+            loop.create_task(self._flush_after_window(key, entry))
+        entry[1].append((row, explain, future))
+        if len(entry[1]) >= self.max_batch:
+            self._take(key, entry)
+            loop.create_task(self._run(entry))
+
+        return await future
+
+    def _take(self, key, entry):
+        """Detach entry from the pending map. False if it was already taken."""
+        if self._pending.get(key) is not entry:
+            return False
+        del self._pending[key]
+        return True
+
+    async def _flush_after_window(self, key, entry):
+        await asyncio.sleep(self.window)
+        if self._take(key, entry):
+            await self._run(entry)
+
+    async def _run(self, entry):
+        bundle, items = entry
+        X = np.vstack([row for row, _, _ in items])
+        explain = any(e for _, e, _ in items)
+        self.batches += 1
+        self.rows += len(items)
+        try:
+            classes, probas, contribs = await self.executor.score(bundle, X, explain)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (_, row_explain, future) in enumerate(items):
+            if not future.done():
+                row_contribs = contribs[i] if (contribs is not None and row_explain) else None
+                future.set_result((classes[i], probas[i], row_contribs))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": round(self.rows / self.batches, 2) if self.batches else None,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils.contributions import ContributionEngine
+    from utils.model_registry import ModelBundle, base_source
+
+    source = base_source()
+    model = load_model_file(source.model_path)
+    bundle = ModelBundle(source, model, None, None, None, ContributionEngine(model), {})
+    n_features = model.n_features_in_
+    rows = np.random.default_rng(0).random((256, n_features)) * 50
+
+    async def bench(kind, window_ms, concurrency=256):
+        executor = InferenceExecutor(kind, INFERENCE_WORKERS)
+        executor.start(bundle)
+        batcher = MicroBatcher(executor, window_ms=window_ms)
+        await batcher.score_row(bundle, rows[:1])   # warm the pool
+        batcher.batches = batcher.rows = 0
+
+        # Event-loop responsiveness: how late does a 1 ms ticker fire while scoring?
+        lag = []
+
+        async def ticker():
+            while True:
+                t = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lag.append(time.perf_counter() - t - 0.001)
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*[batcher.score_row(bundle, rows[i:i + 1]) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        tick.cancel()
+        executor.shutdown()
+        print(f"{kind:7s} window={window_ms:>4} ms  {concurrency} requests in {elapsed * 1000:7.1f} ms  "
+              f"batches={batcher.batches:3d}  max loop lag={max(lag or [0]) * 1000:5.1f} ms")
+
+    def inline():
+        started = time.perf_counter()
+        for i in range(256):
+            score_matrix(bundle.model, bundle.explainer, rows[i:i + 1])
+        print(f"inline  (blocks the loop)  256 requests in {(time.perf_counter() - started) * 1000:7.1f} ms")
+
+    inline()
+    asyncio.run(bench("thread", 0))
+    asyncio.run(bench("thread", INFERENCE_BATCH_WINDOW_MS))
+    asyncio.run(bench("process", INFERENCE_BATCH_WINDOW_MS))
@@ -0,0 +1,93 @@
+"""Cache for LLM risk insights.
+
+The insight prompt is fully determined by the patient record, the top SHAP
+factors, the predicted class and the probability, so the generated text is
+cached under a hash of those inputs. Entries live in an in-process LRU/TTL
+tier and, when a path is configured, in a small SQLite file so they survive
+restarts.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from utils.cache import TTLCache
+
+
+def insight_cache_key(patient: dict, shap_factors: list, pred_class, prob, models: str = "") -> str:
+    """Stable hash of the prompt inputs (key order and float noise do not matter)."""
+    payload = {
+        "patient": patient,
+        "factors": [
+            {"feature": f["feature"], "impact": round(float(f["impact"]), 4)}
+            for f in shap_factors
+        ],
+        "class": int(pred_class),
+        # The prompt renders the probability as a 2-decimal percentage
+        "probability": round(float(prob), 4),
+        "models": models,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class InsightCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 86400.0, path: str = None):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.persistent_hits = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS insights "
+                    "(key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                print("Insight cache: persistent store unavailable, using memory only:", e)
+                self._db = None
+
+    def get(self, key: str):
+        text = self.memory.get(key)
+        if text is not None or self._db is None:
+            return text
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT text, created_at FROM insights WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] + self.ttl < time.time():
+            return None
+
+        self.persistent_hits += 1
+        self.memory.set(key, row[0])
+        return row[0]
+
+    def set(self, key: str, text: str):
+        self.memory.set(key, text)
+        if self._db is None:
+            return
+
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO insights (key, text, created_at) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        # A persistent hit is first counted as a memory miss
+        stats["misses"] -= self.persistent_hits
+        stats["memory_hits"] = stats.pop("hits")
+        stats["persistent_hits"] = self.persistent_hits
+        stats["persistent"] = self._db is not None
+        total = stats["memory_hits"] + self.persistent_hits + stats["misses"]
+        stats["hit_rate"] = round((total - stats["misses"]) / total, 4) if total else None
+        return stats
@@ -0,0 +1,446 @@
+"""Postgres-backed job queue for long-running analyses.
+
+/analyze/* used to hold the HTTP connection open for the whole LLM
+pipeline. Under load, proxies time those requests out, clients retry, and
+the work gets done twice. Submitting a job instead stores the upload in
+Postgres and answers 202 with a job id straight away. A pool of
+JOB_WORKERS asyncio workers in every app process then claims queued jobs
+(FOR UPDATE SKIP LOCKED, so processes never take the same job) and runs
+the registered handler.
+
+Clients can poll GET /jobs/{id}. When the job carries a callback URL,
+its final state is also POSTed there. Results are patient reports, so
+callback hosts must be listed in JOB_CALLBACK_ALLOWED_HOSTS when that is
+set, and must otherwise resolve to public addresses only (no loopback,
+private, link-local or metadata endpoints). The check runs at submit time
+and again right before each delivery, and the delivery connects to the
+address that was checked (no second DNS lookup to rebind).
+
+Recovery after a restart or crash:
+  - Running jobs send a heartbeat every JOB_HEARTBEAT_SECONDS.
+  - On startup, and periodically afterwards, jobs whose heartbeat is older
+    than JOB_STALE_SECONDS are requeued. After JOB_MAX_ATTEMPTS they are
+    marked failed.
+  - A clean shutdown requeues this process's running jobs straight away.
+
+An Idempotency-Key on submit maps a retried submission to the existing job.
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import time
+import uuid
+from urllib.parse import urlparse
+
+import httpx
+
+from utils.db import DATABASE_URL, get_pg_pool
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "900"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "3"))
+# Comma-separated callback hosts; when set, only these are allowed (internal hosts included)
+JOB_CALLBACK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+        id UUID PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        callback_url TEXT,
+        idempotency_key TEXT UNIQUE,
+        attempts INT NOT NULL DEFAULT 0,
+        result JSONB,
+        error TEXT,
+        locked_by TEXT,
+        heartbeat_at TIMESTAMPTZ,
+        callback_status TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS analysis_jobs_queued ON analysis_jobs (created_at) WHERE status = 'queued'",
+    """
+    CREATE TABLE IF NOT EXISTS analysis_job_files (
+        job_id UUID NOT NULL REFERENCES analysis_jobs (id) ON DELETE CASCADE,
+        position INT NOT NULL,
+        filename TEXT,
+        content_type TEXT,
+        data BYTEA NOT NULL,
+        PRIMARY KEY (job_id, position)
+    )
+    """,
+]
+
+CLAIM_SQL = """
+    UPDATE analysis_jobs
+    SET status = 'running', attempts = attempts + 1, locked_by = $1,
+        started_at = NOW(), heartbeat_at = NOW()
+    WHERE id = (
+        SELECT id FROM analysis_jobs
+        WHERE status = 'queued'
+        ORDER BY created_at
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id, kind, callback_url, attempts
+"""
+
+RECOVER_STALE_SQL = """
+    UPDATE analysis_jobs
+    SET status = CASE WHEN attempts >= $2 THEN 'failed' ELSE 'queued' END,
+        error = CASE WHEN attempts >= $2 THEN 'Worker stopped responding (max attempts reached)' ELSE error END,
+        finished_at = CASE WHEN attempts >= $2 THEN NOW() ELSE NULL END,
+        locked_by = NULL
+    WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => $1)
+    RETURNING id, status
+"""
+
+JOB_COLUMNS = """
+    id, kind, status, callback_url, attempts, result, error, callback_status,
+    created_at, started_at, finished_at
+"""
+
+
+async def resolve_callback_url(url: str):
+    """
+    (reason, address): reason why url may not receive job results (None if
+    it may), and the checked public IP to connect to. The address is None
+    for allowlisted hosts, which are trusted as they resolve.
+    """
+    parsed = urlparse(url)
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        return "callback_url has an invalid port", None
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url must be an http(s) URL", None
+
+    host = parsed.hostname.lower()
+    if JOB_CALLBACK_ALLOWED_HOSTS:
+        return (None if host in JOB_CALLBACK_ALLOWED_HOSTS else f"callback host {host} is not allowed"), None
+
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        return f"callback host {host} does not resolve", None
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    if not addresses or not all(address.is_global for address in addresses):
+        return f"callback host {host} resolves to a non-public address", None
+    return None, str(addresses[0])
+
+
+async def check_callback_url(url: str):
+    """Why url may not receive job results (None if it may). See the module docstring."""
+    reason, _ = await resolve_callback_url(url)
+    return reason
+
+
+def pinned_callback_request(url: str, address: str):
+    """
+    (url, headers, extensions) that connect to the already-checked address
+    instead of resolving the host again. A second lookup could return a
+    private IP (DNS rebinding). The Host header and TLS SNI / certificate
+    check still use the real host name.
+    """
+    original = httpx.URL(url)
+    if address is None:
+        return original, {}, {}
+    return (
+        original.copy_with(host=address),
+        {"Host": original.netloc.decode("ascii")},
+        {"sni_hostname": original.host},
+    )
+
+
+def job_to_dict(row) -> dict:
+    result = row["result"]
+    return {
+        "job_id": str(row["id"]),
+        "kind": row["kind"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+        "result": json.loads(result) if isinstance(result, str) else result,
+        "error": row["error"],
+        "callback_url": row["callback_url"],
+        "callback_status": row["callback_status"],
+    }
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = max(1, workers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}   # kind -> async handler(files) -> result dict
+        self._tasks = []
+        self._wakeup = None
+        self._schema_ready = False
+
+    @property
+    def available(self) -> bool:
+        return bool(DATABASE_URL)
+
+    def register(self, kind: str, handler):
+        """handler(files) is awaited with [(filename, content_type, bytes), ...] and returns the result."""
+        self.handlers[kind] = handler
+
+    async def ensure_schema(self):
+        if self._schema_ready:
+            return
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            for statement in SCHEMA_SQL:
+                await con.execute(statement)
+        self._schema_ready = True
+
+    # ---------------------------------------------------------
+    # Submit / read
+    # ---------------------------------------------------------
+    async def submit(self, kind: str, files: list, callback_url: str = None, idempotency_key: str = None):
+        """Store the job + its files. Returns (job dict, created); created is False on an idempotent replay."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        await self.ensure_schema()
+
+        job_id = uuid.uuid4()
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            async with con.transaction():
+                inserted = await con.fetchval(
+                    """
+                    INSERT INTO analysis_jobs (id, kind, callback_url, idempotency_key)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (idempotency_key) DO NOTHING
+                    RETURNING id
+                    """,
+                    job_id, kind, callback_url, idempotency_key,
+                )
+                if inserted is None:
+                    existing = await con.fetchrow(
+                        f"SELECT {JOB_COLUMNS} FROM analysis_jobs WHERE idempotency_key = $1", idempotency_key
+                    )
+                    return job_to_dict(existing), False
+
+                await con.executemany(
+                    """
+                    INSERT INTO analysis_job_files (job_id, position, filename, content_type, data)
+                    VALUES ($1, $2, $3, $4, $5)
+                    """,
+                    [(job_id, i, name, ctype, data) for i, (name, ctype, data) in enumerate(files)],
+                )
+            row = await con.fetchrow(f"SELECT {JOB_COLUMNS} FROM analysis_jobs WHERE id = $1", job_id)
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_to_dict(row), True
+
+    async def get(self, job_id: str):
+        try:
+            job_uuid = uuid.UUID(job_id)
+        except ValueError:
+            return None
+        await self.ensure_schema()
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            row = await con.fetchrow(f"SELECT {JOB_COLUMNS} FROM analysis_jobs WHERE id = $1", job_uuid)
+        return job_to_dict(row) if row else None
+
+    # ---------------------------------------------------------
+    # Workers
+    # ---------------------------------------------------------
+    async def start(self):
+        """Create the tables, recover stale jobs and start the workers (idempotent)."""
+        if self._tasks:
+            return
+        await self.ensure_schema()
+        await self.recover_stale()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+        print(f"✅ Job queue: {self.workers} worker(s) as {self.worker_id}")
+
+    async def stop(self):
+        """Cancel the workers and hand this process's running jobs back to the queue."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if not tasks:
+            return
+        try:
+            pool = await get_pg_pool()
+            async with pool.acquire() as con:
+                await con.execute(
+                    "UPDATE analysis_jobs SET status = 'queued', locked_by = NULL "
+                    "WHERE status = 'running' AND locked_by = $1",
+                    self.worker_id,
+                )
+        except Exception as e:
+            print("Failed to requeue running jobs on shutdown:", e)
+
+    async def recover_stale(self):
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            rows = await con.fetch(RECOVER_STALE_SQL, JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+        for row in rows:
+            print(f"♻️ Recovered stale job {row['id']} → {row['status']}")
+        return len(rows)
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(JOB_STALE_SECONDS / 2)
+            try:
+                await self.recover_stale()
+            except Exception as e:
+                print("Job reaper error:", e)
+
+    async def _claim(self):
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            return await con.fetchrow(CLAIM_SQL, self.worker_id)
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                print(f"Job worker {n} claim failed:", e)
+                job = None
+
+            if job is None:
+                # Idle: wait for a local submit or the next poll (other processes may submit)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except Exception as e:
+                # e.g. the pool dropped while recording the result. The job keeps
+                # its lock and the reaper requeues it once the heartbeat goes stale;
+                # this worker stays alive.
+                print(f"Job worker {n} error on job {job['id']}:", e)
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def _heartbeat(self, job_id):
+        pool = await get_pg_pool()
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                async with pool.acquire() as con:
+                    await con.execute(
+                        "UPDATE analysis_jobs SET heartbeat_at = NOW() WHERE id = $1 AND locked_by = $2",
+                        job_id, self.worker_id,
+                    )
+            except Exception as e:
+                print(f"Job {job_id} heartbeat failed:", e)
+
+    async def _run(self, job):
+        job_id, kind = job["id"], job["kind"]
+        started = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        result, error = None, None
+        try:
+            pool = await get_pg_pool()
+            async with pool.acquire() as con:
+                rows = await con.fetch(
+                    "SELECT filename, content_type, data FROM analysis_job_files WHERE job_id = $1 ORDER BY position",
+                    job_id,
+                )
+            files = [(r["filename"], r["content_type"], bytes(r["data"])) for r in rows]
+
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind {kind!r}")
+            result = await asyncio.wait_for(handler(files), JOB_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            # Shutting down: stop() hands the job back to the queue
+            heartbeat.cancel()
+            raise
+        except asyncio.TimeoutError:
+            error = f"Timed out after {JOB_TIMEOUT_SECONDS:g}s"
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed:", e)
+            error = str(e) or e.__class__.__name__
+        finally:
+            heartbeat.cancel()
+
+        status = "failed" if error else "succeeded"
+        row = await self._finish(job_id, status, result, error)
+        print(f"{'✅' if status == 'succeeded' else '❌'} Job {job_id} ({kind}) {status} in {time.perf_counter() - started:.1f}s")
+
+        if row is not None and row["callback_url"]:
+            await self._deliver_callback(job_to_dict(row))
+
+    async def _finish(self, job_id, status, result, error):
+        pool = await get_pg_pool()
+        async with pool.acquire() as con:
+            async with con.transaction():
+                row = await con.fetchrow(
+                    f"""
+                    UPDATE analysis_jobs
+                    SET status = $2, result = $3::jsonb, error = $4, finished_at = NOW(), locked_by = NULL
+                    WHERE id = $1 AND locked_by = $5
+                    RETURNING {JOB_COLUMNS}
+                    """,
+                    job_id, status,
+                    json.dumps(result, default=str) if result is not None else None,
+                    error, self.worker_id,
+                )
+                if row is not None:
+                    # The uploads are no longer needed once the job is final
+                    await con.execute("DELETE FROM analysis_job_files WHERE job_id = $1", job_id)
+        return row
+
+    async def _deliver_callback(self, job: dict):
+        payload = json.loads(json.dumps(job, default=str))
+        outcome = None
+        # Redirects are not followed: they could point anywhere
+        async with httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT, follow_redirects=False) as client:
+            for attempt in range(JOB_CALLBACK_RETRIES):
+                # Re-checked per attempt: DNS may have changed since submit.
+                # The POST goes to the address that passed the check.
+                reason, address = await resolve_callback_url(job["callback_url"])
+                if reason:
+                    outcome = f"refused ({reason})"
+                    break
+                url, headers, extensions = pinned_callback_request(job["callback_url"], address)
+                try:
+                    response = await client.post(url, json=payload, headers=headers, extensions=extensions)
+                    if response.status_code < 400:
+                        outcome = f"delivered ({response.status_code})"
+                        break
+                    outcome = f"failed ({response.status_code})"
+                except Exception as e:
+                    outcome = f"failed ({e.__class__.__name__})"
+                if attempt < JOB_CALLBACK_RETRIES - 1:
+                    await asyncio.sleep(2 ** attempt)
+
+        print(f"Job {job['job_id']} callback {outcome}")
+        try:
+            pool = await get_pg_pool()
+            async with pool.acquire() as con:
+                await con.execute(
+                    "UPDATE analysis_jobs SET callback_status = $2 WHERE id = $1",
+                    uuid.UUID(job["job_id"]), outcome,
+                )
+        except Exception as e:
+            print("Failed to record callback status:", e)
@@ -0,0 +1,179 @@
+"""Risk-model artifacts: native XGBoost format + a direct booster inference path.
+
+``xgboost_health_model.pkl`` is a pickled sklearn-API ``XGBClassifier``: slow
+to unpickle, tied to exact library versions, and every call goes through the
+wrapper's validation path. The same booster saved in XGBoost's own UBJSON
+(or JSON) format loads faster, survives library upgrades, and can be called
+directly with ``inplace_predict``.
+
+Convert once and compare against the pickle (run from backend/):
+
+    python -m utils.model_artifacts convert [--json]
+    python -m utils.model_artifacts bench
+"""
+
+import os
+import time
+
+import joblib
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PICKLE_MODEL_PATH = os.path.join(BASE_DIR, "xgboost_health_model.pkl")
+NATIVE_MODEL_PATH = os.getenv("MODEL_NATIVE_PATH", os.path.join(BASE_DIR, "xgboost_health_model.ubj"))
+
+# auto   → native artifact when present, else the pickle
+# native → native only, pickle → pickle only
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "auto").strip().lower()
+
+
+class NativeBoosterModel:
+    """
+    Binary classifier backed by a bare xgboost.Booster.
+    Exposes the predict / predict_proba / get_booster subset the app uses,
+    plus predict_with_proba which gets both from ONE inference.
+    """
+
+    def __init__(self, booster, threshold: float = 0.5):
+        self.booster = booster
+        self.threshold = threshold
+        self.feature_names = booster.feature_names
+        self.n_features_in_ = booster.num_features()
+
+        best_iteration = booster.attr("best_iteration")
+        self.iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+
+    @classmethod
+    def load(cls, path: str):
+        import xgboost as xgb
+
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return cls(booster)
+
+    def get_booster(self):
+        return self.booster
+
+    def positive_proba(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        return self.booster.inplace_predict(X, iteration_range=self.iteration_range)
+
+    def predict_with_proba(self, X):
+        proba = self.positive_proba(X)
+        return (proba > self.threshold).astype(int), proba
+
+    def predict_proba(self, X) -> np.ndarray:
+        proba = self.positive_proba(X)
+        return np.column_stack([1.0 - proba, proba])
+
+    def predict(self, X) -> np.ndarray:
+        return self.predict_with_proba(X)[0]
+
+
+def native_model_available() -> bool:
+    return MODEL_FORMAT != "pickle" and os.path.exists(NATIVE_MODEL_PATH)
+
+
+def model_artifact_path() -> str:
+    """The base model file to load (the registry's base source reads this)."""
+    if native_model_available():
+        return NATIVE_MODEL_PATH
+    if MODEL_FORMAT == "native":
+        raise FileNotFoundError(f"MODEL_FORMAT=native but {NATIVE_MODEL_PATH} does not exist")
+    return PICKLE_MODEL_PATH
+
+
+def load_model_file(path: str):
+    """Load one model artifact; the format follows the extension (.ubj / .json native, else pickle)."""
+    if os.path.splitext(path)[1].lower() in (".ubj", ".json"):
+        return NativeBoosterModel.load(path)
+    return joblib.load(path)
+
+
+def predict_class_and_proba(model, X):
+    """
+    (classes, positive-class probabilities) from a single inference pass,
+    instead of separate predict + predict_proba calls.
+    """
+    if hasattr(model, "predict_with_proba"):
+        return model.predict_with_proba(X)
+
+    proba_matrix = model.predict_proba(X)
+    class_index = np.argmax(proba_matrix, axis=1)
+    classes = getattr(model, "classes_", None)
+    if classes is not None:
+        class_index = np.asarray(classes)[class_index]
+    return class_index.astype(int), proba_matrix[:, 1]
+
+
+def convert_pickle_to_native(pickle_path: str = PICKLE_MODEL_PATH, native_path: str = NATIVE_MODEL_PATH):
+    """One-shot conversion; the format follows the extension (.ubj or .json)."""
+    model = joblib.load(pickle_path)
+    model.get_booster().save_model(native_path)
+    return model
+
+
+if __name__ == "__main__":
+    import sys
+
+    from utils.feature_encoding import dataset_feature_matrix
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+
+    if command == "convert":
+        target = NATIVE_MODEL_PATH
+        if "--json" in sys.argv:
+            target = os.path.splitext(target)[0] + ".json"
+        pickled = convert_pickle_to_native(PICKLE_MODEL_PATH, target)
+        native = NativeBoosterModel.load(target)
+
+        X = np.random.default_rng(0).random((1000, native.n_features_in_)) * 100
+        diff = np.abs(pickled.predict_proba(X)[:, 1] - native.positive_proba(X)).max()
+        print(f"Wrote {target} ({os.path.getsize(target) / 1024:.0f} KB), max |Δp| vs pickle = {diff:.2e}")
+        sys.exit(0)
+
+    if command != "bench":
+        sys.exit("usage: python -m utils.model_artifacts [convert [--json] | bench]")
+
+    import xgboost  # noqa: F401  (import cost is not part of the artifact load time)
+
+    def timed_load(fn):
+        t = time.perf_counter()
+        obj = fn()
+        return obj, time.perf_counter() - t
+
+    pickled, pickle_load = timed_load(lambda: joblib.load(PICKLE_MODEL_PATH))
+    if not os.path.exists(NATIVE_MODEL_PATH):
+        sys.exit(f"{NATIVE_MODEL_PATH} missing — run `python -m utils.model_artifacts convert` first")
+    native, native_load = timed_load(lambda: NativeBoosterModel.load(NATIVE_MODEL_PATH))
+
+    X, _, _ = dataset_feature_matrix(BASE_DIR)
+
+    def per_row(fn):
+        fn(X[:1])
+        samples = []
+        for i in range(len(X)):
+            row = X[i:i + 1]
+            t = time.perf_counter()
+            fn(row)
+            samples.append(time.perf_counter() - t)
+        return np.percentile(samples, 50) * 1e3, np.percentile(samples, 99) * 1e3
+
+    def batch(fn):
+        t = time.perf_counter()
+        fn(X)
+        return (time.perf_counter() - t) * 1e3
+
+    current = lambda rows: (pickled.predict(rows), pickled.predict_proba(rows))
+
+    print(f"load      pickle {pickle_load * 1e3:8.1f} ms   native {native_load * 1e3:8.1f} ms")
+    p50, p99 = per_row(current)
+    print(f"per-row   predict+predict_proba (pickle)  p50 {p50:.3f} ms  p99 {p99:.3f} ms  batch {batch(current):.2f} ms")
+    p50, p99 = per_row(native.predict_with_proba)
+    print(f"per-row   predict_with_proba   (native)  p50 {p50:.3f} ms  p99 {p99:.3f} ms  batch {batch(native.predict_with_proba):.2f} ms")
+
+    classes, proba = native.predict_with_proba(X)
+    print(
+        f"agreement classes {np.mean(classes == pickled.predict(X)) * 100:.1f}%  "
+        f"max |Δp| {np.abs(proba - pickled.predict_proba(X)[:, 1]).max():.2e}"
+    )
@@ -0,0 +1,233 @@
+"""Versioned risk-model artifacts with zero-downtime hot reload.
+
+A deployment ships a retrained model as a new directory under
+MODEL_REGISTRY_DIR (default backend/models/):
+
+    models/
+      2025-01-14/
+        model.ubj            (or model.json / model.pkl)
+        encoders.pkl
+        feature_order.pkl
+        model_metrics.json   (optional)
+
+Copy the files into a temporary name and rename the directory into place,
+so a half-written version is never picked up. Incomplete directories are
+ignored. The newest version by name wins, unless MODEL_VERSION pins one.
+With no registry directory, the legacy artifacts in backend/ are served as
+version "base".
+
+ModelRegistry polls for changes every MODEL_REGISTRY_POLL seconds on a
+daemon thread. It loads and warms the new version off the request path,
+then publishes it with a single reference assignment. A request that
+grabbed the previous bundle finishes on it undisturbed. A version that
+fails to load is logged and skipped, and the current version keeps serving.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from utils.model_artifacts import BASE_DIR, model_artifact_path
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(BASE_DIR, "models"))
+MODEL_REGISTRY_POLL = float(os.getenv("MODEL_REGISTRY_POLL", "30"))
+PINNED_MODEL_VERSION = os.getenv("MODEL_VERSION", "").strip() or None
+
+MODEL_FILE_NAMES = ("model.ubj", "model.json", "model.pkl",
+                    "xgboost_health_model.ubj", "xgboost_health_model.json", "xgboost_health_model.pkl")
+BASE_METRICS_PATH = os.path.join(BASE_DIR, "routes", "model_metrics.json")
+
+
+class ModelSource:
+    """Where one model version's artifacts live on disk."""
+
+    def __init__(self, version, model_path, encoders_path, feature_order_path, metrics_path=None):
+        self.version = version
+        self.model_path = model_path
+        self.encoders_path = encoders_path
+        self.feature_order_path = feature_order_path
+        self.metrics_path = metrics_path if metrics_path and os.path.exists(metrics_path) else None
+
+    @property
+    def signature(self):
+        """Changes when the version or any of its files change."""
+        paths = [self.model_path, self.encoders_path, self.feature_order_path, self.metrics_path]
+        return (self.version, tuple(os.path.getmtime(p) if p and os.path.exists(p) else None for p in paths))
+
+    def load_metrics(self):
+        if not self.metrics_path:
+            return {}
+        with open(self.metrics_path, "r") as f:
+            return json.load(f)
+
+
+class ModelBundle:
+    """Everything one model version serves with. Swapped as a unit, never mutated."""
+
+    def __init__(self, source, model, encoders, feature_order, encoding_plan, explainer, metrics):
+        self.version = source.version
+        self.signature = source.signature
+        self.source = source
+        self.model = model
+        self.encoders = encoders
+        self.feature_order = feature_order
+        self.encoding_plan = encoding_plan
+        self.explainer = explainer
+        self.metrics = metrics
+        self.loaded_at = time.time()
+
+
+def _version_sort_key(name):
+    # Natural order, so v10 sorts after v9 and dates sort chronologically
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def base_source():
+    """The legacy artifacts in backend/ (used when the registry is empty)."""
+    return ModelSource(
+        "base",
+        model_artifact_path(),
+        os.path.join(BASE_DIR, "encoders.pkl"),
+        os.path.join(BASE_DIR, "feature_order.pkl"),
+        BASE_METRICS_PATH,
+    )
+
+
+def version_source(version):
+    """ModelSource for a registry directory, or None if it is incomplete."""
+    path = os.path.join(MODEL_REGISTRY_DIR, version)
+    model_path = next(
+        (os.path.join(path, n) for n in MODEL_FILE_NAMES if os.path.exists(os.path.join(path, n))), None
+    )
+    encoders_path = os.path.join(path, "encoders.pkl")
+    feature_order_path = os.path.join(path, "feature_order.pkl")
+    if not model_path or not os.path.exists(encoders_path) or not os.path.exists(feature_order_path):
+        return None
+    metrics_path = next(
+        (os.path.join(path, n) for n in ("model_metrics.json", "metrics.json") if os.path.exists(os.path.join(path, n))),
+        None,
+    )
+    return ModelSource(version, model_path, encoders_path, feature_order_path, metrics_path)
+
+
+def available_versions():
+    """Complete version directories, oldest first."""
+    try:
+        names = [n for n in os.listdir(MODEL_REGISTRY_DIR)
+                 if os.path.isdir(os.path.join(MODEL_REGISTRY_DIR, n)) and not n.startswith(".")]
+    except OSError:
+        return []
+    return [n for n in sorted(names, key=_version_sort_key) if version_source(n)]
+
+
+def select_source():
+    """The version that should be serving: pinned, else newest, else the base artifacts."""
+    versions = available_versions()
+    if PINNED_MODEL_VERSION:
+        if PINNED_MODEL_VERSION in versions:
+            return version_source(PINNED_MODEL_VERSION)
+        if PINNED_MODEL_VERSION != "base":
+            print(f"Warning: MODEL_VERSION={PINNED_MODEL_VERSION} not found in {MODEL_REGISTRY_DIR}")
+        return base_source()
+    if versions:
+        return version_source(versions[-1])
+    return base_source()
+
+
+class ModelRegistry:
+    """
+    Holds the active ModelBundle and hot-swaps it when a new version appears.
+
+    load_bundle(source) builds a ModelBundle and warm_bundle(bundle) runs a
+    dummy inference. Both run with no request waiting on them, except the
+    very first load.
+    """
+
+    def __init__(self, load_bundle, warm_bundle=None, poll_seconds=MODEL_REGISTRY_POLL):
+        self.load_bundle = load_bundle
+        self.warm_bundle = warm_bundle
+        self.poll_seconds = poll_seconds
+        self.active = None
+        self.last_error = None
+        self._failed_signature = None
+        self._load_lock = threading.Lock()
+        self._watcher = None
+
+    def _load(self, source):
+        started = time.perf_counter()
+        bundle = self.load_bundle(source)
+        if self.warm_bundle:
+            self.warm_bundle(bundle)
+        print(f"✅ Model version {bundle.version} loaded + warmed in {time.perf_counter() - started:.2f}s")
+        return bundle
+
+    def ensure_loaded(self) -> bool:
+        """Load the selected version once (single-flight). False if it failed."""
+        if self.active is not None:
+            return True
+        with self._load_lock:
+            if self.active is not None:
+                return True
+            try:
+                self.active = self._load(select_source())
+                self.last_error = None
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                print("Warning: Failed to load model or encoders:", self.last_error)
+                return False
+
+    def check_for_update(self) -> bool:
+        """Load, warm and swap in a changed version. True if a swap happened."""
+        if self.active is None:
+            return self.ensure_loaded()
+
+        with self._load_lock:
+            source = select_source()
+            signature = source.signature
+            if signature == self.active.signature or signature == self._failed_signature:
+                return False
+
+            try:
+                bundle = self._load(source)
+            except Exception as e:
+                # Keep serving the current version; don't retry until the files change again
+                self._failed_signature = signature
+                self.last_error = f"version {source.version}: {str(e).strip().splitlines()[0] if str(e).strip() else e!r}"
+                print(f"❌ Model version {source.version} failed to load, keeping {self.active.version}:", e)
+                return False
+
+            previous = self.active.version
+            self.active = bundle   # atomic publish: readers see the old or the new bundle, never a mix
+            self._failed_signature = None
+            self.last_error = None
+            print(f"🔁 Model swapped: {previous} → {bundle.version}")
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.check_for_update()
+            except Exception as e:
+                print("Model registry watcher error:", e)
+
+    def start_watcher(self):
+        """Poll for new versions on a daemon thread (idempotent; disabled when poll <= 0)."""
+        if self._watcher is not None or self.poll_seconds <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        active = self.active
+        return {
+            "active_version": active.version if active else None,
+            "loaded_at": active.loaded_at if active else None,
+            "available_versions": available_versions(),
+            "pinned_version": PINNED_MODEL_VERSION,
+            "registry_dir": MODEL_REGISTRY_DIR,
+            "last_error": self.last_error,
+        }
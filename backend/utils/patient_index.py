@@ -0,0 +1,128 @@
+"""In-memory patient_id index over the CSV dataset.
+
+Replaces the per-request boolean-mask scan
+(``dataset_df[dataset_df["patient_id"] == pid]``) with an O(1) dict lookup.
+Rows are kept column-wise as plain Python lists (native int / float / str),
+so a lookup only has to zip one row back into a fresh record dict. That is as
+cheap as copying a prebuilt dict (callers mutate the record, so they need a
+copy anyway) and costs a fraction of the memory of one dict per row.
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class PatientIndex:
+    def __init__(self, df: pd.DataFrame, id_col: str = "patient_id"):
+        started = time.perf_counter()
+
+        self.columns = list(df.columns)
+        self.column_values = [df[col].tolist() for col in self.columns]
+        self.positions = {}
+
+        if id_col in df.columns:
+            # setdefault keeps the FIRST row for duplicate ids, same as .iloc[0]
+            for pos, patient_id in enumerate(self.column_values[self.columns.index(id_col)]):
+                self.positions.setdefault(patient_id, pos)
+
+        self.build_seconds = time.perf_counter() - started
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, patient_id):
+        return patient_id in self.positions
+
+    def get(self, patient_id):
+        """Fresh record dict for patient_id, or None if unknown."""
+        pos = self.positions.get(patient_id)
+        if pos is None:
+            return None
+        return {col: values[pos] for col, values in zip(self.columns, self.column_values)}
+
+    def memory_bytes(self, sample_size: int = 1000) -> int:
+        """
+        Approximate resident size of the index: the id → position dict, the
+        column lists, and the row values (estimated from a sample of rows).
+        """
+        total = sys.getsizeof(self.positions)
+        total += sum(sys.getsizeof(values) for values in self.column_values)
+
+        n_rows = len(self.column_values[0]) if self.column_values else 0
+        if n_rows:
+            step = max(1, n_rows // sample_size)
+            sample = range(0, n_rows, step)
+            per_row = sum(
+                sys.getsizeof(values[pos]) for values in self.column_values for pos in sample
+            ) / len(sample)
+            total += int(per_row * n_rows)
+
+        return total
+
+    def describe(self) -> str:
+        return (
+            f"{len(self)} ids, ~{self.memory_bytes() / (1024 * 1024):.1f} MB, "
+            f"built in {self.build_seconds * 1000:.0f} ms"
+        )
+
+
+class VisitBuckets:
+    """
+    visit count → row offsets, built once at dataset load.
+
+    Rows are stably sorted by visit count, so every bucket (and every
+    min..max range of buckets) is one contiguous slice of ``order`` found
+    with two binary searches. Results are serialized from column arrays
+    with fancy indexing instead of ``iterrows``.
+    """
+
+    def __init__(self, df: pd.DataFrame, visit_col: str, name_col: str = "Patients_Name"):
+        started = time.perf_counter()
+
+        visits = pd.to_numeric(df[visit_col], errors="coerce").to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnan(visits))
+        self.order = valid[np.argsort(visits[valid], kind="stable")]
+        self.sorted_visits = visits[self.order]
+
+        n = len(df)
+        self.ids = df["patient_id"].to_numpy(dtype=object) if "patient_id" in df.columns else np.full(n, None, dtype=object)
+        self.names = (
+            df[name_col].fillna("Unknown").to_numpy(dtype=object)
+            if name_col in df.columns else np.full(n, "Unknown", dtype=object)
+        )
+        self.visits = np.nan_to_num(visits).astype(np.int64)
+
+        self.build_seconds = time.perf_counter() - started
+
+    def counts(self) -> dict:
+        """{visit_count: number_of_patients}, ascending."""
+        keys, sizes = np.unique(self.sorted_visits, return_counts=True)
+        return {int(k): int(v) for k, v in zip(keys, sizes)}
+
+    def query(self, min_visits=None, max_visits=None, cursor: int = 0, limit: int = 500):
+        """
+        Patients with min_visits <= visits <= max_visits (either bound optional),
+        ordered by visit count then dataset order.
+        Returns (patients, total, next_cursor); next_cursor is None on the last page.
+        """
+        lo = 0 if min_visits is None else int(np.searchsorted(self.sorted_visits, min_visits, side="left"))
+        hi = len(self.order) if max_visits is None else int(np.searchsorted(self.sorted_visits, max_visits, side="right"))
+        total = max(0, hi - lo)
+
+        start = lo + max(0, cursor)
+        end = min(start + max(0, limit), hi)
+        offsets = self.order[start:end] if start < end else self.order[:0]
+
+        patients = [
+            {"patient_id": pid, "patient_name": name, "visit_count": visit}
+            for pid, name, visit in zip(
+                self.ids[offsets].tolist(),
+                self.names[offsets].tolist(),
+                self.visits[offsets].tolist(),
+            )
+        ]
+        next_cursor = end - lo if end < hi else None
+        return patients, total, next_cursor
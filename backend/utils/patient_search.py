@@ -0,0 +1,154 @@
+"""In-memory patient name search for the patient picker.
+
+Built once when the dataset loads, replacing a per-keystroke
+``str.contains`` regex scan + ``iterrows``. Work is done per distinct
+lowercase name (real extracts repeat names a lot), each mapping to its rows:
+
+* a sorted array of distinct names and one of (name token, name), so
+  prefix matches ("rag", "sethi") are a binary search;
+* a trigram → name-ids inverted index: intersecting the postings of the
+  query's trigrams narrows substring candidates (confirmed with ``in``), and
+  overlap counts rank typo-tolerant matches ("raghv", "sethy").
+
+Results are ranked full-name prefix → word prefix → substring → fuzzy and
+are assembled from precomputed result columns.
+"""
+
+import time
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# Minimum share of the query's trigrams a name must contain to count as a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.4
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PatientSearchIndex:
+    def __init__(self, df: pd.DataFrame, name_col: str = "Patients_Name", visit_col: str = None):
+        started = time.perf_counter()
+        self.has_names = name_col in df.columns
+
+        names = df[name_col].fillna("").astype(str).tolist() if self.has_names else [""] * len(df)
+        ids = df["patient_id"].tolist() if "patient_id" in df.columns else [None] * len(df)
+        visits = df[visit_col].tolist() if visit_col in df.columns else [None] * len(df)
+
+        # Result fields kept column-wise; a result dict is zipped per hit,
+        # which is far lighter than holding one dict per row for millions of rows
+        self.ids = ids
+        self.display_names = [name or "Unknown" for name in names]
+        self.visit_counts = visits
+
+        # Distinct lowercase names (sorted) → rows carrying that name
+        rows_by_name = {}
+        for row, name in enumerate(names):
+            rows_by_name.setdefault(name.lower(), []).append(row)
+        self.names = sorted(rows_by_name)
+        self.name_rows = [rows_by_name[name] for name in self.names]
+
+        # Word prefix array (surnames, middle names, ...), name order within a token
+        tokens = sorted(
+            (token, name_id)
+            for name_id, name in enumerate(self.names)
+            for token in name.split()[1:]
+        )
+        self.tokens = [t for t, _ in tokens]
+        self.token_names = [n for _, n in tokens]
+
+        # Trigram inverted index over distinct names
+        postings = {}
+        for name_id, name in enumerate(self.names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(name_id)
+        self.postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        self.build_seconds = time.perf_counter() - started
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _prefix(sorted_keys, ids_for, q):
+        i = bisect_left(sorted_keys, q)
+        while i < len(sorted_keys) and sorted_keys[i].startswith(q):
+            yield ids_for[i] if ids_for is not None else i
+            i += 1
+
+    def search(self, q: str, limit: int = 10) -> list:
+        q = " ".join(q.lower().split())
+        if not q or limit <= 0:
+            return []
+
+        seen, ranked = set(), []
+
+        def take(name_ids):
+            for name_id in name_ids:
+                if name_id in seen:
+                    continue
+                seen.add(name_id)
+                ranked.extend(self.name_rows[name_id])
+                if len(ranked) >= limit:
+                    return True
+            return False
+
+        # 1) full-name prefix, 2) word prefix — both already in name order
+        if take(self._prefix(self.names, None, q)):
+            return self._results(ranked[:limit])
+        if take(self._prefix(self.tokens, self.token_names, q)):
+            return self._results(ranked[:limit])
+
+        # 3) substring, in name order — a real `q in name` check over the candidates
+        if take(name_id for name_id in self._substring_candidates(q) if q in self.names[name_id]):
+            return self._results(ranked[:limit])
+
+        # 4) fuzzy — ranked by trigram overlap, the only tier with a similarity threshold
+        q_grams = trigrams(q)
+        lists = [self.postings[g] for g in q_grams if g in self.postings]
+        if lists:
+            candidates, counts = np.unique(np.concatenate(lists), return_counts=True)
+            similarity = counts / len(q_grams)
+            keep = similarity >= FUZZY_MIN_SIMILARITY
+            fuzzy = sorted(
+                (-sim, name_id)
+                for name_id, sim in zip(candidates[keep].tolist(), similarity[keep].tolist())
+                if name_id not in seen
+            )
+            take(name_id for _, name_id in fuzzy)
+
+        return self._results(ranked[:limit])
+
+    def _substring_candidates(self, q: str):
+        """Name ids that may contain q: every name holding q also holds each trigram
+        inside q (unpadded), so intersecting those postings loses nothing. Queries
+        shorter than three characters have no such trigram and scan the distinct names."""
+        inner = {q[i:i + 3] for i in range(len(q) - 2)}
+        if not inner:
+            return range(len(self.names))
+        if any(g not in self.postings for g in inner):
+            return []
+        lists = sorted((self.postings[g] for g in inner), key=len)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        return candidates.tolist()
+
+    def _results(self, rows) -> list:
+        return [
+            {
+                "patient_id": self.ids[row],
+                "patient_name": self.display_names[row],
+                "visit_count": self.visit_counts[row],
+            }
+            for row in rows
+        ]
+
+    def describe(self) -> str:
+        return (
+            f"{len(self)} rows, {len(self.names)} distinct names, {len(self.postings)} trigrams, "
+            f"built in {self.build_seconds * 1000:.0f} ms"
+        )
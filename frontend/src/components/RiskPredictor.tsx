@@ -75,7 +75,7 @@ export default function RiskPredictor() {
   }, [visitCount]);
 
   /* --------------------------------
-     Predict Risk (UNCHANGED)
+     Predict Risk (streamed: prediction first, summary as it arrives)
   --------------------------------- */
   async function predict() {
     if (!patientId) {
@@ -89,32 +89,69 @@ export default function RiskPredictor() {
     setDetails(null);
 
     try {
-      const res = await fetch(`${API_BASE}/api/predict-risk`, {
+      const res = await fetch(`${API_BASE}/api/predict-risk/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ patient_id: patientId }),
       });
 
-      const data = await res.json();
-      if (!res.ok) throw new Error(data.detail || "Prediction failed");
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({}));
+        throw new Error(data.detail || "Prediction failed");
+      }
 
-      const newResult = {
-        prediction: data.prediction,
-        probability: data.probability,
-        top_factors: data.top_factors,
-        summary: data.summary || "",
-        bullets: data.bullets || [],
-      };
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let newResult: any = null;
+      let patientData: any = null;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE frames are separated by a blank line
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const frame = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const payload = frame.match(/^data: (.*)$/m)?.[1];
+          if (!event || !payload) continue;
+          const data = JSON.parse(payload);
+
+          if (event === "prediction") {
+            newResult = {
+              prediction: data.prediction,
+              probability: data.probability,
+              top_factors: data.top_factors,
+              summary: "",
+              bullets: [],
+            };
+            patientData = data.patient_data || null;
+            setResult(newResult);
+            setDetails(patientData);
+            setLoading(false);
+          } else if (event === "summary" && newResult) {
+            newResult = { ...newResult, summary: newResult.summary + data.delta };
+            setResult(newResult);
+          } else if (event === "done" && newResult) {
+            newResult = { ...newResult, summary: data.summary };
+            setResult(newResult);
+          }
+        }
+      }
 
-      setResult(newResult);
-      setDetails(data.patient_data || null);
+      if (!newResult) throw new Error("Prediction failed");
 
       sessionStorage.setItem(
         "risk_result",
         JSON.stringify({
           patientId,
           result: newResult,
-          details: data.patient_data || null,
+          details: patientData,
         })
       );
     } catch (err: any) {